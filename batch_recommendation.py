@@ -0,0 +1,174 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("BATCH_RECOMMENDATION_CHUNK_SIZE", "1000000"))
+
+INPUT_COLUMNS = ["asset_size", "monthly_salary", "age", "mbti"]
+
+# 구간 상한 (RAG.calculate_income_level과 같은 값, 상한 이하면 해당 구간)
+# searchsorted(side="left")는 x 이하인 첫 상한의 위치를 돌려주므로 +1 하면 1~10 수준이 된다.
+ASSET_BRACKETS = np.array([5000000, 10000000, 20000000, 30000000, 50000000,
+                           70000000, 100000000, 200000000, 500000000], dtype=np.float64)
+SALARY_BRACKETS = np.array([1500000, 2000000, 2500000, 3000000, 3500000,
+                            4000000, 4500000, 5000000, 7000000], dtype=np.float64)
+# 소득 분위 3 이하 적금, 6 이하 예금, 그 외 채권 (RAG.classify_product_with_mbti)
+INCOME_BRACKETS = np.array([3, 6])
+BASE_RECOMMENDATIONS = np.array(["적금", "예금", "채권"], dtype=object)
+
+# 기본 추천별 추가 메시지 (코드 0은 추가 메시지 없음)
+ADVICE_MESSAGES = np.array([
+    "",
+    " - 하지만 고수익을 원하신다면 예금을 고려해보세요.",
+    " - 더 높은 수익을 원하신다면 채권도 추천됩니다.",
+    " - 단기적인 투자 성향이라면 적금도 적합할 수 있습니다.",
+    " - 안정성을 원하시면 예금도 고려해보세요.",
+], dtype=object)
+# (기본 추천, 추가 메시지) 조합별 완성된 메시지: 행마다 문자열을 만들지 않고 코드로 골라 씀
+MESSAGE_TABLE = np.array([f"{base} (소득 분위 기준){advice}" for base in BASE_RECOMMENDATIONS
+                          for advice in ADVICE_MESSAGES], dtype=object)
+ERROR_RECOMMENDATION = ("미지정", "추천 과정에서 오류가 발생했습니다.")
+
+
+# 자산/월급 배열 -> 소득 분위 배열
+# 숫자가 아니거나 비어 있는 값은 스칼라 함수의 오류 처리와 같게 0으로 둔다.
+def income_levels(asset_sizes, monthly_salaries):
+    assets = np.asarray(asset_sizes, dtype=np.float64)
+    salaries = np.asarray(monthly_salaries, dtype=np.float64)
+    asset_levels = np.searchsorted(ASSET_BRACKETS, assets, side="left") + 1
+    salary_levels = np.searchsorted(SALARY_BRACKETS, salaries, side="left") + 1
+    # np.round도 Python round처럼 .5를 짝수 쪽으로 반올림
+    levels = np.round((asset_levels + salary_levels) / 2).astype(np.int64)
+    levels[np.isnan(assets) | np.isnan(salaries)] = 0
+    return levels
+
+
+# MBTI 문자열 배열 -> (I 포함, J 포함, N 포함, 유효 여부) boolean 배열
+# 고유값마다 한 번만 문자열을 검사하고, factorize 코드로 전체 행에 펼친다.
+def mbti_traits(mbtis):
+    import pandas as pd
+    codes, uniques = pd.factorize(pd.Series(mbtis, dtype=object), use_na_sentinel=True)
+    table = np.zeros((len(uniques) + 1, 4), dtype=bool)  # 마지막 행은 결측값(code -1)
+    for index, value in enumerate(uniques):
+        if isinstance(value, str):
+            upper = value.upper()
+            table[index] = ("I" in upper, "J" in upper, "N" in upper, True)
+    traits = table[codes]
+    return traits[:, 0], traits[:, 1], traits[:, 2], traits[:, 3]
+
+
+# 소득 분위와 MBTI 배열 -> (기본 추천, 추천 메시지) 배열
+# RAG.classify_product_with_mbti의 분기를 np.select로 옮긴 것
+def recommend(levels, mbtis):
+    introvert, judging, intuitive, valid = mbti_traits(mbtis)
+    base = np.searchsorted(INCOME_BRACKETS, np.asarray(levels), side="left")
+    advice = np.select(
+        [(base == 0) & (~introvert | intuitive),
+         (base == 1) & ~introvert & intuitive,
+         (base == 1) & ~judging,
+         (base == 2) & introvert & ~intuitive],
+        [1, 2, 3, 4],
+        default=0,
+    )
+    recommendations = BASE_RECOMMENDATIONS[base]
+    messages = MESSAGE_TABLE[base * len(ADVICE_MESSAGES) + advice]
+    recommendations[~valid] = ERROR_RECOMMENDATION[0]
+    messages[~valid] = ERROR_RECOMMENDATION[1]
+    return recommendations, messages
+
+
+# 고객 프로필 DataFrame에 income_level, base_recommendation, recommendation_message 열을 추가
+def recommend_frame(frame):
+    import pandas as pd
+    missing = [column for column in ("asset_size", "monthly_salary", "mbti") if column not in frame.columns]
+    if missing:
+        raise ValueError(f"입력에 필요한 열이 없습니다: {missing}")
+    levels = income_levels(pd.to_numeric(frame["asset_size"], errors="coerce"),
+                           pd.to_numeric(frame["monthly_salary"], errors="coerce"))
+    recommendations, messages = recommend(levels, frame["mbti"].to_numpy(dtype=object))
+    return frame.assign(income_level=levels, base_recommendation=recommendations,
+                        recommendation_message=messages)
+
+
+def _is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+# 입력 파일을 chunk_size행씩 읽음 (파일 전체를 메모리에 올리지 않음)
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    import pandas as pd
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype={"mbti": object})
+
+
+# 결과를 chunk 단위로 이어 쓰는 writer (CSV는 첫 chunk에만 header, Parquet은 하나의 파일에 row group 추가)
+class RecommendationWriter:
+    def __init__(self, path):
+        self.path = path
+        self._parquet = None
+        self._started = False
+
+    def write(self, frame):
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# 고객 목록 파일 전체 추천
+def recommend_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    started = time.perf_counter()
+    stats = {"rows": 0, "invalid": 0}
+    with RecommendationWriter(output_path) as writer:
+        for frame in read_chunks(input_path, chunk_size=chunk_size):
+            result = recommend_frame(frame)
+            writer.write(result)
+            stats["rows"] += len(result)
+            stats["invalid"] += int((result["base_recommendation"] == ERROR_RECOMMENDATION[0]).sum())
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_second"] = round(stats["rows"] / elapsed) if elapsed > 0 else None
+    logger.info(f"{input_path} -> {output_path}: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="고객 프로필 CSV/Parquet 파일에 대해 상품 추천을 일괄 계산합니다.")
+    parser.add_argument("input", help="asset_size, monthly_salary, age, mbti 열을 가진 CSV 또는 Parquet 파일")
+    parser.add_argument("output", help="결과 파일 (.parquet이면 Parquet, 그 외는 CSV)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="한 번에 처리하는 행 수")
+    args = parser.parse_args()
+
+    stats = recommend_file(args.input, args.output, chunk_size=args.chunk_size)
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import copy
+import logging
+import os
+import threading
+import uuid as uuid_lib
+
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# 배치 크기와 실패 객체 재시도 횟수 (환경 변수로 조정 가능)
+DEFAULT_BATCH_SIZE = int(os.getenv("WEAVIATE_BATCH_SIZE", "100"))
+DEFAULT_MAX_RETRIES = int(os.getenv("WEAVIATE_BATCH_RETRIES", "3"))
+
+# client.batch 는 클라이언트 전체에서 하나의 버퍼를 공유하므로 flush 단위로 직렬화
+_batch_lock = threading.Lock()
+
+
+# client.batch 를 수동 모드로 전환
+# 기본값(dynamic, 약 50개)이면 add_data_object 도중 클라이언트가 스스로 전송해 버려서
+# create_objects()가 마지막 일부의 결과만 돌려주고, 먼저 전송된 객체의 오류는 알 수 없게 된다.
+def use_manual_batching(client):
+    with _batch_lock:
+        if client.batch.batch_size is not None:
+            client.batch.configure(batch_size=None, dynamic=False, callback=None)
+
+
+# Weaviate batch API 기반 writer
+# 객체를 모아 두었다가 batch_size 마다 한 번의 HTTP 요청으로 전송하고,
+# 객체별 오류를 수집해 실패한 객체만 재시도한다.
+class BatchWriter:
+    def __init__(self, client, batch_size=DEFAULT_BATCH_SIZE, max_retries=DEFAULT_MAX_RETRIES, on_error=None,
+                 on_flush=None, on_success=None):
+        use_manual_batching(client)
+        self.client = client
+        self.batch_size = max(1, int(batch_size))
+        self.max_retries = max(0, int(max_retries))
+        self.on_error = on_error
+        self.on_flush = on_flush
+        self.on_success = on_success
+        self._pending = []
+        self.succeeded = []
+        self.failed = []
+        self.requests_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # 예외가 발생해도 이미 쌓인 객체는 전송
+        self.flush()
+        return False
+
+    def add(self, data_object, class_name="Document", uuid=None, vector=None):
+        # 재시도 시 중복 생성을 막기 위해 UUID를 미리 지정
+        object_id = str(uuid) if uuid else str(uuid_lib.uuid4())
+        self._pending.append({
+            "uuid": object_id,
+            "class_name": class_name,
+            "data_object": data_object,
+            "vector": vector,
+        })
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return object_id
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        attempt = 0
+        written = []
+        while pending:
+            errors = self._send(pending)
+            retry = [item for item in pending if item["uuid"] in errors]
+            written.extend(item for item in pending if item["uuid"] not in errors)
+            self.succeeded.extend(item["uuid"] for item in pending if item["uuid"] not in errors)
+
+            if not retry:
+                break
+            if attempt >= self.max_retries:
+                for item in retry:
+                    self._report_failure(item, errors[item["uuid"]])
+                break
+
+            attempt += 1
+            logger.warning(f"{len(retry)}개 객체 배치 저장 실패, 재시도 {attempt}/{self.max_retries}")
+            pending = retry
+
+        if metrics.enabled:
+            for item in written:
+                metrics.count("weaviate_objects_total", class_name=item["class_name"], result="written")
+        # 저장에 성공한 객체 목록 전달 (추천 색인 갱신 등)
+        if self.on_success and written:
+            self.on_success(written)
+        # 쓰기가 반영된 뒤 호출 (조회 캐시 무효화 등)
+        if self.on_flush:
+            self.on_flush()
+
+    def _send(self, items):
+        errors = {}
+        with _batch_lock:
+            try:
+                for item in items:
+                    self.client.batch.add_data_object(
+                        data_object=item["data_object"],
+                        class_name=item["class_name"],
+                        uuid=item["uuid"],
+                        vector=item["vector"],
+                    )
+                results = self.client.batch.create_objects()
+                self.requests_sent += 1
+            except Exception as e:
+                # 요청 자체가 실패한 경우 남아 있는 버퍼를 비우고 전체를 실패로 처리
+                self.client.batch.empty_objects()
+                logger.error(f"Weaviate 배치 요청 오류: {e}")
+                return {item["uuid"]: str(e) for item in items}
+
+        for result in results or []:
+            error_list = (result.get("result") or {}).get("errors", {}).get("error", [])
+            if error_list:
+                message = "; ".join(err.get("message", "") for err in error_list)
+                errors[str(result.get("id"))] = message
+        return errors
+
+    def _report_failure(self, item, message):
+        failure = dict(item, error=message)
+        metrics.count("weaviate_objects_total", class_name=item["class_name"], result="failed")
+        self.failed.append(failure)
+        filename = item["data_object"].get("filename", item["uuid"])
+        logger.error(f"{filename} 객체 저장 실패 ({item['class_name']}): {message}")
+        if self.on_error:
+            self.on_error(failure)
+
+
+# where 필터에 맞는 객체를 batch delete API로 한 번에 삭제
+# 한 번의 요청으로 지울 수 있는 수(서버의 QUERY_MAXIMUM_RESULTS)를 넘으면 남은 객체에 대해 반복한다.
+def delete_where(client, class_name, where, dry_run=False):
+    total = {"matches": 0, "successful": 0, "failed": 0}
+    while True:
+        # 클라이언트가 where dict를 변형하므로 매번 복사본을 넘김
+        result = client.batch.delete_objects(class_name=class_name, where=copy.deepcopy(where),
+                                             output="minimal", dry_run=dry_run)
+        results = result.get("results", {})
+        for key in total:
+            total[key] += results.get(key) or 0
+        limit = results.get("limit")
+        if dry_run or not results.get("successful") or limit is None or results.get("matches", 0) < limit:
+            break
+    logger.info(f"{class_name} 일괄 삭제: {total}")
+    return total
+
+
+# where 필터에 맞는 객체를 offset 페이지 단위로 모두 읽음 (cursor는 where와 함께 쓸 수 없음)
+def fetch_where(client, class_name, fields, where, page_size=100, additional=None):
+    additional = ["id"] + [item for item in (additional or []) if item != "id"]
+    objects, offset = [], 0
+    while True:
+        response = (
+            client.query.get(class_name, fields)
+            .with_where(where)
+            .with_additional(additional)
+            .with_limit(page_size)
+            .with_offset(offset)
+            .do()
+        )
+        if response.get("errors"):
+            raise RuntimeError(response["errors"])
+        page = response.get("data", {}).get("Get", {}).get(class_name) or []
+        objects.extend(page)
+        if len(page) < page_size:
+            return objects
+        offset += page_size
+
+
+# where 필터에 맞는 객체 전체에 properties를 덮어써서 배치로 다시 저장
+# batch API는 같은 UUID의 객체를 통째로 교체하므로 기존 속성과 벡터를 읽어 합친 뒤 저장한다.
+def update_where(client, class_name, where, properties, writer=None, page_size=100):
+    schema = client.schema.get(class_name)
+    # 참조(cross-reference) 속성은 데이터 타입이 클래스 이름(대문자 시작)이므로 제외
+    fields = [prop["name"] for prop in schema.get("properties", []) if prop["dataType"][0][:1].islower()]
+    objects = fetch_where(client, class_name, fields, where, page_size=page_size, additional=["vector"])
+
+    writer = writer or BatchWriter(client)
+    updated = []
+    with writer:
+        for obj in objects:
+            additional = obj.pop("_additional", {}) or {}
+            data_object = {key: value for key, value in obj.items() if value is not None}
+            data_object.update(properties)
+            writer.add(data_object, class_name=class_name, uuid=additional.get("id"), vector=additional.get("vector"))
+            updated.append(data_object)
+
+    failed = {failure["uuid"] for failure in writer.failed}
+    result = {"matches": len(objects), "successful": len(objects) - len(failed), "failed": len(failed),
+              "objects": updated}
+    logger.info(f"{class_name} 일괄 수정: 대상 {result['matches']}개, 실패 {result['failed']}개")
+    return result
@@ -0,0 +1,742 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIR = os.getenv("INGEST_DATA_DIR", "신한은행_데이터")
+DEFAULT_TOLERANCE = 0.2
+
+# 앞의 네 개는 상품 조회 경로(MBTI/카테고리 포함), 뒤의 네 개는 문서 검색 + LLM 경로로 라우팅된다.
+CHAT_QUERIES = [
+    "INTJ에게 맞는 적금 추천해줘",
+    "ENFP 예금 상품 알려줘",
+    "채권 상품 목록 보여줘",
+    "ISTP 청년 상품 있어?",
+    "중도 해지하면 이자는 어떻게 돼?",
+    "우대금리를 받으려면 어떤 조건이 필요해?",
+    "비과세 혜택이 있는 상품이 있어?",
+    "가입 기간은 최대 몇 년까지 가능해?",
+]
+
+
+# ---------------------------------------------------------------------------
+# Weaviate 대역: v3 클라이언트가 쓰는 GraphQL Get, 스키마, data object, batch 엔드포인트를 메모리에서 처리
+# ---------------------------------------------------------------------------
+
+GRAPHQL_TOKEN_RE = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)|([A-Za-z_][A-Za-z0-9_]*)|(.))',
+                              re.S)
+
+
+def tokenize_graphql(query):
+    tokens = []
+    for match in GRAPHQL_TOKEN_RE.finditer(query):
+        string, number, name, punct = match.groups()
+        if string is not None:
+            tokens.append(("value", json.loads(string.replace("\n", "\\n"))))
+        elif number is not None:
+            tokens.append(("value", float(number) if re.search(r"[.eE]", number) else int(number)))
+        elif name is not None:
+            tokens.append(("name", name))
+        elif punct is not None and punct.strip() and punct != ",":
+            tokens.append(("punct", punct))
+    return tokens
+
+
+# {Get{Class(args){field _additional {id}}}} -> [(이름, 인자 dict, 하위 선택 목록), ...]
+class GraphQLParser:
+    def __init__(self, query):
+        self.tokens = tokenize_graphql(query)
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self, expected=None):
+        token = self._peek()
+        if expected is not None and token != ("punct", expected):
+            raise ValueError(f"GraphQL 구문 오류: {expected!r} 위치에 {token!r}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        return self._selection()
+
+    def _selection(self):
+        self._take("{")
+        fields = []
+        while self._peek() != ("punct", "}"):
+            _, name = self._take()
+            arguments, children = {}, []
+            if self._peek() == ("punct", "("):
+                self._take("(")
+                arguments = self._arguments(")")
+            if self._peek() == ("punct", "{"):
+                children = self._selection()
+            fields.append((name, arguments, children))
+        self._take("}")
+        return fields
+
+    def _arguments(self, closing):
+        arguments = {}
+        while self._peek() != ("punct", closing):
+            _, name = self._take()
+            self._take(":")
+            arguments[name] = self._value()
+        self._take(closing)
+        return arguments
+
+    def _value(self):
+        kind, value = self._take()
+        if kind == "punct" and value == "[":
+            items = []
+            while self._peek() != ("punct", "]"):
+                items.append(self._value())
+            self._take("]")
+            return items
+        if kind == "punct" and value == "{":
+            return self._arguments("}")
+        if kind == "name":
+            return {"true": True, "false": False, "null": None}.get(value, value)
+        return value
+
+
+def _filter_value(where):
+    for key, value in where.items():
+        if key.startswith("value"):
+            return value
+    return None
+
+
+# Weaviate의 text 필터는 단어 토큰화로 대소문자를 구분하지 않으므로 소문자로 비교
+def _normalize_filter_value(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def matches_where(object_id, properties, where):
+    operator = where.get("operator")
+    if operator == "And":
+        return all(matches_where(object_id, properties, operand) for operand in where.get("operands", []))
+    if operator == "Or":
+        return any(matches_where(object_id, properties, operand) for operand in where.get("operands", []))
+    path = where.get("path") or []
+    field = path[-1] if path else None
+    actual = object_id if field == "id" else properties.get(field)
+    expected = _filter_value(where)
+    actual_values = actual if isinstance(actual, list) else [actual]
+    actual_values = {_normalize_filter_value(value) for value in actual_values}
+    if operator == "Equal":
+        return _normalize_filter_value(expected) in actual_values
+    if operator == "NotEqual":
+        return _normalize_filter_value(expected) not in actual_values
+    if operator == "ContainsAny":
+        expected_values = expected if isinstance(expected, list) else [expected]
+        return any(_normalize_filter_value(value) in actual_values for value in expected_values)
+    if operator == "ContainsAll":
+        expected_values = expected if isinstance(expected, list) else [expected]
+        return all(_normalize_filter_value(value) in actual_values for value in expected_values)
+    raise ValueError(f"지원하지 않는 where 연산자: {operator}")
+
+
+def _infer_data_type(value):
+    if isinstance(value, bool):
+        return ["boolean"]
+    if isinstance(value, int):
+        return ["int"]
+    if isinstance(value, float):
+        return ["number"]
+    if isinstance(value, list):
+        return ["text[]"]
+    return ["text"]
+
+
+class FakeWeaviate:
+    def __init__(self, latency_ms=0.0, default_limit=10, delete_limit=10000):
+        self.latency = latency_ms / 1000.0
+        self.default_limit = default_limit
+        self.delete_limit = delete_limit
+        self.classes = {}
+        self.objects = {}
+        self.requests = {}
+        # batch 저장 시 객체별 오류로 돌려줄 UUID (부분 실패 재현용)
+        self.rejected_ids = set()
+        self._lock = threading.RLock()
+        self._server = None
+
+    # 스키마는 남기고 객체만 비움
+    def reset(self):
+        with self._lock:
+            self.objects = {name: {} for name in self.classes}
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null") if length else None
+                status, payload = fake.handle(method, urlparse(self.path).path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-weaviate", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, method, path, body):
+        parts = [part for part in path.split("/") if part][1:]  # "/v1/..." 의 v1 제외
+        endpoint = f"{method} /{'/'.join(parts[:2])}"
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            return self._route(method, parts, body)
+        except Exception as e:
+            logger.exception(f"Fake Weaviate 오류: {method} {path}")
+            return 500, {"error": [{"message": str(e)}]}
+
+    def _route(self, method, parts, body):
+        head = parts[0] if parts else ""
+        if head == ".well-known":
+            if parts[1:] in (["ready"], ["live"]):
+                return 200, {}
+            return 404, {}
+        if head == "meta":
+            return 200, {"hostname": "http://[::]:8080", "version": "1.24.0", "modules": {}}
+        if head == "nodes":
+            with self._lock:
+                count = sum(len(objects) for objects in self.objects.values())
+            return 200, {"nodes": [{"name": "benchmark", "status": "HEALTHY", "version": "1.24.0",
+                                    "stats": {"objectCount": count, "shardCount": len(self.objects)}}]}
+        if head == "schema":
+            return self._schema(method, parts[1:], body)
+        if head == "graphql" and method == "POST":
+            return 200, self.graphql(body.get("query", ""))
+        if head == "batch" and parts[1:] == ["objects"]:
+            if method == "POST":
+                return 200, self.batch_create(body.get("objects", []))
+            if method == "DELETE":
+                return 200, self.batch_delete(body)
+        if head == "objects":
+            return self._data_object(method, parts[1:], body)
+        return 404, {"error": [{"message": f"unsupported endpoint {method} /{'/'.join(parts)}"}]}
+
+    def _schema(self, method, parts, body):
+        with self._lock:
+            if method == "GET" and not parts:
+                return 200, {"classes": list(self.classes.values())}
+            if method == "GET":
+                schema = self.classes.get(parts[0])
+                return (200, schema) if schema else (404, {})
+            if method == "POST" and not parts:
+                body.setdefault("properties", [])
+                self.classes[body["class"]] = body
+                self.objects.setdefault(body["class"], {})
+                return 200, body
+            if method == "POST" and parts[1:] == ["properties"]:
+                self.classes[parts[0]]["properties"].append(body)
+                return 200, body
+            if method == "DELETE":
+                self.classes.pop(parts[0], None)
+                self.objects.pop(parts[0], None)
+                return 200, {}
+        return 404, {}
+
+    def _ensure_class(self, class_name, properties):
+        schema = self.classes.get(class_name)
+        if schema is None:
+            schema = self.classes[class_name] = {"class": class_name, "properties": []}
+            self.objects.setdefault(class_name, {})
+        known = {prop["name"] for prop in schema["properties"]}
+        for name, value in properties.items():
+            if name not in known and value is not None:
+                schema["properties"].append({"name": name, "dataType": _infer_data_type(value)})
+
+    def _store(self, class_name, object_id, properties, vector):
+        self._ensure_class(class_name, properties)
+        self.objects[class_name][object_id] = {
+            "properties": dict(properties),
+            "vector": np.asarray(vector, dtype=np.float32) if vector is not None else None,
+        }
+
+    def _data_object(self, method, parts, body):
+        with self._lock:
+            if method == "POST" and not parts:
+                object_id = body.get("id") or str(uuid.uuid4())
+                self._store(body["class"], object_id, body.get("properties") or {}, body.get("vector"))
+                return 200, dict(body, id=object_id)
+            if len(parts) < 2:
+                return 404, {}
+            class_name, object_id = parts[0], parts[1]
+            stored = self.objects.get(class_name, {}).get(object_id)
+            if method == "GET":
+                if stored is None:
+                    return 404, {}
+                return 200, {"class": class_name, "id": object_id, "properties": stored["properties"]}
+            if method in ("PUT", "PATCH"):
+                properties = body.get("properties") or {}
+                if method == "PATCH" and stored is not None:
+                    properties = dict(stored["properties"], **properties)
+                vector = body.get("vector")
+                if vector is None and stored is not None:
+                    vector = stored["vector"]
+                self._store(class_name, object_id, properties, vector)
+                return 200, dict(body, id=object_id)
+            if method == "DELETE":
+                return (204, {}) if self.objects.get(class_name, {}).pop(object_id, None) else (404, {})
+        return 404, {}
+
+    def batch_create(self, objects):
+        results = []
+        with self._lock:
+            for obj in objects:
+                object_id = obj.get("id") or str(uuid.uuid4())
+                if object_id in self.rejected_ids:
+                    results.append(dict(obj, id=object_id, result={"errors": {"error": [{"message": "rejected"}]}}))
+                    continue
+                self._store(obj["class"], object_id, obj.get("properties") or {}, obj.get("vector"))
+                results.append(dict(obj, id=object_id, result={}))
+        return results
+
+    def batch_delete(self, body):
+        match = body.get("match") or {}
+        class_name = match.get("class")
+        dry_run = body.get("dryRun", False)
+        with self._lock:
+            objects = self.objects.get(class_name, {})
+            matched = [object_id for object_id, stored in objects.items()
+                       if matches_where(object_id, stored["properties"], match.get("where") or {})]
+            matched = matched[:self.delete_limit]
+            if not dry_run:
+                for object_id in matched:
+                    del objects[object_id]
+        return {"match": match, "output": body.get("output"), "dryRun": dry_run,
+                "results": {"matches": len(matched), "successful": 0 if dry_run else len(matched), "failed": 0,
+                            "limit": self.delete_limit, "objects": None}}
+
+    def graphql(self, query):
+        data, errors = {}, []
+        for name, _, children in GraphQLParser(query).parse():
+            if name != "Get":
+                errors.append({"message": f"unsupported operation {name}"})
+                continue
+            data["Get"] = {}
+            for class_name, arguments, selection in children:
+                if class_name not in self.classes:
+                    errors.append({"message": f"Cannot query field \"{class_name}\" on type \"GetObjectsObj\"."})
+                    continue
+                data["Get"][class_name] = self._get(class_name, arguments, selection)
+        response = {"data": data}
+        if errors:
+            response["errors"] = errors
+        return response
+
+    def _get(self, class_name, arguments, selection):
+        with self._lock:
+            items = list(self.objects.get(class_name, {}).items())
+        where = arguments.get("where")
+        if where:
+            items = [(object_id, stored) for object_id, stored in items
+                     if matches_where(object_id, stored["properties"], where)]
+
+        distances = {}
+        near_vector = arguments.get("nearVector")
+        if near_vector:
+            items = [(object_id, stored) for object_id, stored in items if stored["vector"] is not None]
+            if items:
+                query = np.asarray(near_vector["vector"], dtype=np.float32)
+                matrix = np.stack([stored["vector"] for _, stored in items])
+                norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+                norms[norms == 0] = 1.0
+                cosine = matrix @ query / norms
+                order = np.argsort(-cosine)
+                distances = {items[index][0]: float(1 - cosine[index]) for index in order}
+                items = [items[index] for index in order]
+        else:
+            items.sort(key=lambda item: item[0])
+            if arguments.get("after"):
+                items = [item for item in items if item[0] > arguments["after"]]
+
+        offset = arguments.get("offset") or 0
+        limit = arguments.get("limit") or self.default_limit
+        results = []
+        for object_id, stored in items[offset:offset + limit]:
+            result = {}
+            for field, _, children in selection:
+                if field == "_additional":
+                    additional = {}
+                    for name, _, _ in children:
+                        if name == "id":
+                            additional["id"] = object_id
+                        elif name == "vector":
+                            vector = stored["vector"]
+                            additional["vector"] = vector.tolist() if vector is not None else None
+                        elif name == "distance":
+                            additional["distance"] = distances.get(object_id)
+                    result["_additional"] = additional
+                else:
+                    result[field] = stored["properties"].get(field)
+            results.append(result)
+        return results
+
+
+# ---------------------------------------------------------------------------
+# OpenAI 대역: ChatCompletion(일반/스트리밍)과 Embedding을 지연 시간, 토큰 수, 429 오류를 흉내 내어 응답
+# ---------------------------------------------------------------------------
+
+class FakeLLM:
+    def __init__(self, latency_ms=300.0, jitter=0.3, completion_tokens=150, rate_limit_rate=0.0,
+                 retry_after_ms=50, embedding_latency_ms=20.0, embedding_dim=256, seed=0):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter
+        self.completion_tokens = completion_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.embedding_latency = embedding_latency_ms / 1000.0
+        self.embedding_dim = embedding_dim
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"chat_calls": 0, "embedding_calls": 0, "rate_limited": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    # 429는 ChatCompletion에만 발생시킴 (재시도는 LLMScheduler가 담당하고, 임베딩 호출에는 재시도가 없음)
+    def _sleep(self, base, rate_limited=False):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+            limited = rate_limited and self._random.random() < self.rate_limit_rate
+        if limited:
+            import openai
+            self._count(rate_limited=1)
+            raise openai.error.RateLimitError("Rate limit reached (benchmark)",
+                                              headers={"retry-after-ms": str(self.retry_after_ms)})
+        time.sleep(max(0.0, base * factor))
+
+    # openai 모듈의 ChatCompletion.create, Embedding.create를 대역으로 교체 (RAG를 import하기 전에 호출)
+    def install(self):
+        import openai
+        openai.ChatCompletion.create = self.chat_completion
+        openai.Embedding.create = self.embedding
+
+    def _answer(self, messages):
+        from document_analysis import ANALYSIS_PROMPT, CATEGORIES, MBTI_TYPES
+        text = messages[-1].get("content") or ""
+        digest = int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+        if messages and messages[0].get("content") == ANALYSIS_PROMPT:
+            category = next((category for category in CATEGORIES if category in text), CATEGORIES[digest % 4])
+            return json.dumps({
+                "category": category,
+                "mbti": MBTI_TYPES[digest % len(MBTI_TYPES)],
+                "summary": f"{category} 상품, 기본 이자율 연 {2 + digest % 3}.{digest % 10}%, 우대 조건 충족 시 추가 금리",
+                "key_facts": ["가입 대상: 개인", f"가입 기간: {12 * (1 + digest % 3)}개월", "비과세 혜택 없음"],
+            }, ensure_ascii=False)
+        return " ".join(["답변"] * self.completion_tokens)
+
+    def chat_completion(self, model=None, messages=None, max_tokens=None, stream=False, **kwargs):
+        from openai.openai_object import OpenAIObject
+        from llm_scheduler import estimate_tokens
+        self._sleep(self.latency, rate_limited=True)
+        content = self._answer(messages or [])
+        prompt_tokens = estimate_tokens(messages)
+        completion_tokens = min(max_tokens or self.completion_tokens, estimate_tokens([{"content": content}]))
+        self._count(chat_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if stream:
+            words = content.split(" ")
+            return (OpenAIObject.construct_from({"choices": [{"delta": {"content": word + " "}, "index": 0}]})
+                    for word in words)
+        return OpenAIObject.construct_from({
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    # 글자 bigram을 해시한 벡터 (같은 단어를 공유하는 문장끼리 가깝도록)
+    def _embed(self, text):
+        vector = np.zeros(self.embedding_dim, dtype=np.float32)
+        text = text or ""
+        for index in range(max(1, len(text) - 1)):
+            bucket = int(hashlib.md5(text[index:index + 2].encode("utf-8")).hexdigest()[:8], 16)
+            vector[bucket % self.embedding_dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embedding(self, model=None, input=None, **kwargs):
+        self._sleep(self.embedding_latency)
+        texts = [input] if isinstance(input, str) else list(input or [])
+        self._count(embedding_calls=1)
+        return {"data": [{"index": index, "embedding": self._embed(text)} for index, text in enumerate(texts)]}
+
+
+# ---------------------------------------------------------------------------
+# 측정
+# ---------------------------------------------------------------------------
+
+def summarize(samples, elapsed, units=None):
+    latencies = np.asarray(samples, dtype=np.float64) * 1000
+    count = len(latencies)
+    summary = {
+        "count": count,
+        "seconds": round(elapsed, 4),
+        "throughput": round(count / elapsed, 3) if elapsed > 0 else None,
+        "mean_ms": round(float(latencies.mean()), 3) if count else None,
+    }
+    for name, q in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)):
+        summary[name] = round(float(np.percentile(latencies, q)), 3) if count else None
+    if units is not None:
+        summary["units"] = units
+        summary["units_per_second"] = round(units / elapsed, 3) if elapsed > 0 else None
+    return summary
+
+
+# items마다 func을 실행해 항목별 지연 시간과 전체 처리량을 측정 (concurrency > 1 이면 스레드 풀)
+def run_stage(name, items, func, concurrency=1):
+    samples, results = [], []
+
+    def timed(item):
+        started = time.perf_counter()
+        result = func(item)
+        return time.perf_counter() - started, result
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(timed, items))
+    else:
+        outcomes = [timed(item) for item in items]
+    elapsed = time.perf_counter() - started
+    for latency, result in outcomes:
+        samples.append(latency)
+        results.append(result)
+    logger.info(f"[{name}] {len(items)}건, {elapsed:.2f}초")
+    return summarize(samples, elapsed), results
+
+
+def load_pdfs(directory):
+    from ingest import resolve_directory, scan_pdfs
+    directory = resolve_directory(directory)
+    files = scan_pdfs(directory)
+    if not files:
+        raise FileNotFoundError(f"PDF 파일이 없습니다: {directory}")
+    pdfs = []
+    for relpath, path in sorted(files.items()):
+        with open(path, "rb") as f:
+            pdfs.append((relpath, f.read()))
+    return directory, pdfs
+
+
+# 벤치마크 전체 실행
+# 대역 서버와 임시 캐시 디렉터리를 환경 변수로 지정한 뒤 RAG를 import하므로,
+# 실제 Weaviate/OpenAI나 로컬 .cache 에는 접근하지 않는다.
+def run_benchmark(data_dir=DEFAULT_DATA_DIR, workers=None, chat_rounds=3, chat_concurrency=4,
+                  llm_options=None, weaviate_latency_ms=0.0, scheduler_tpm=10000000, scheduler_rpm=100000):
+    fake_weaviate = FakeWeaviate(latency_ms=weaviate_latency_ms).start()
+    fake_llm = FakeLLM(**(llm_options or {}))
+    work_dir = tempfile.mkdtemp(prefix="pm-benchmark-")
+    os.environ.update({
+        "WEAVIATE_URL": fake_weaviate.url,
+        "OPENAI_API_KEY": "benchmark",
+        "SUMMARY_CACHE_PATH": os.path.join(work_dir, "summary_cache.sqlite3"),
+        "PAGE_CACHE_PATH": os.path.join(work_dir, "page_cache.sqlite3"),
+        "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical_index.json"),
+        "LOCAL_INDEX_DIR": os.path.join(work_dir, "vector_index"),
+        "RECOMMENDATION_INDEX_PATH": os.path.join(work_dir, "recommendation_index.json"),
+        "INGEST_MANIFEST_PATH": os.path.join(work_dir, "ingest_manifest.json"),
+        "LLM_TOKENS_PER_MINUTE": str(scheduler_tpm),
+        "LLM_REQUESTS_PER_MINUTE": str(scheduler_rpm),
+        "LLM_RETRY_BASE": "0.05",
+        "LLM_RETRY_MAX": "1",
+    })
+    fake_llm.install()
+
+    import RAG
+    import ingest
+    from pdf_extraction import extract_pdfs, join_pages
+
+    RAG.health_monitor.wait_until_checked()
+    RAG.create_weaviate_schema()
+    directory, pdfs = load_pdfs(data_dir)
+    stages = {}
+
+    # 1. PDF 추출 (페이지 캐시 사용 안 함)
+    def extract(pdf):
+        _, pages = extract_pdfs([pdf], workers=workers, use_cache=False)[0]
+        return pages or []
+
+    stages["extraction"], extracted = run_stage("extraction", pdfs, extract)
+    pages = sum(len(item) for item in extracted)
+    stages["extraction"].update(units=pages, units_per_second=round(pages / stages["extraction"]["seconds"], 3))
+    documents = [(name, join_pages(item)) for (name, _), item in zip(pdfs, extracted) if item]
+
+    # 2. 전처리 + LLM 분석
+    def classify(document):
+        name, content = document
+        return RAG.classify_document(name, content, RAG.preprocess_text(content))
+
+    stages["classification"], data_objects = run_stage("classification", documents, classify)
+
+    # 3. Weaviate 저장 (문서 + 페이지 + 조각 임베딩)
+    stages["ingestion"], _ = run_stage("ingestion", data_objects, RAG.write_document)
+
+    # 4. 대화 질의 (상품 조회 경로와 일반 LLM 경로를 나눠 측정)
+    queries = CHAT_QUERIES * max(1, chat_rounds)
+    product_queries = [query for query in queries if RAG.route_query(query)[0] == RAG.ROUTE_PRODUCT_LOOKUP]
+    free_form_queries = [query for query in queries if query not in product_queries]
+    chat = lambda query: RAG.handle_user_query(query, stream=False)
+    stages["chat_product"], _ = run_stage("chat_product", product_queries, chat, concurrency=chat_concurrency)
+    stages["chat_free_form"], _ = run_stage("chat_free_form", free_form_queries, chat, concurrency=chat_concurrency)
+
+    # 5. 디렉터리 증분 적재 전체 파이프라인 (빈 저장소, 빈 캐시에서 시작)
+    fake_weaviate.reset()
+    RAG.summary_cache.clear()
+    started = time.perf_counter()
+    pipeline = ingest.ingest_directory(directory, manifest_path=os.environ["INGEST_MANIFEST_PATH"], workers=workers)
+    elapsed = time.perf_counter() - started
+    stages["ingest_pipeline"] = summarize([elapsed], elapsed, units=pipeline["committed"])
+    # 한 번 실행한 결과이므로 처리량은 초당 적재 문서 수로 표시
+    stages["ingest_pipeline"]["throughput"] = stages["ingest_pipeline"]["units_per_second"]
+
+    fake_weaviate.stop()
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "data_dir": data_dir, "files": len(pdfs), "pages": pages, "workers": workers,
+            "chat_rounds": chat_rounds, "chat_concurrency": chat_concurrency,
+            "weaviate_latency_ms": weaviate_latency_ms, "llm": llm_options or {},
+        },
+        "stages": stages,
+        "llm": {"fake": fake_llm.stats, "scheduler": dict(RAG.llm.stats)},
+        "weaviate": {"requests": fake_weaviate.requests},
+    }
+
+
+# 기준선과 비교해 지연 시간(p50/p95/p99)이 tolerance 비율 이상 늘었거나 처리량이 줄어든 단계를 반환
+def compare_with_baseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    for name, stage in report["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if base.get(metric) and stage.get(metric) is not None and stage[metric] > base[metric] * (1 + tolerance):
+                regressions.append({"stage": name, "metric": metric, "baseline": base[metric], "current": stage[metric]})
+        if base.get("throughput") and stage.get("throughput") is not None \
+                and stage["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append({"stage": name, "metric": "throughput", "baseline": base["throughput"],
+                                "current": stage["throughput"]})
+    return regressions
+
+
+def format_report(report):
+    def number(value, width):
+        return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+    lines = [f"{'stage':<16}{'count':>7}{'tput/s':>10}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}"]
+    for name, stage in report["stages"].items():
+        lines.append(f"{name:<16}{stage['count']:>7}{number(stage['throughput'], 10)}"
+                     f"{number(stage['p50_ms'], 11)}{number(stage['p95_ms'], 11)}{number(stage['p99_ms'], 11)}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 Weaviate/OpenAI 대역으로 적재와 질의 성능을 측정합니다.")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="PDF 추출 워커 프로세스 수")
+    parser.add_argument("--chat-rounds", type=int, default=3, help="질의 목록 반복 횟수")
+    parser.add_argument("--chat-concurrency", type=int, default=4, help="동시에 보내는 질의 수")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter", type=float, default=0.3, help="지연 시간 변동 비율 (0.3 = ±30%%)")
+    parser.add_argument("--llm-completion-tokens", type=int, default=150)
+    parser.add_argument("--llm-rate-limit", type=float, default=0.0, help="429 오류를 낼 확률 (0~1)")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0)
+    parser.add_argument("--weaviate-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="결과 JSON을 저장할 경로")
+    parser.add_argument("--baseline", help="비교할 기준선 JSON (성능이 나빠지면 종료 코드 1)")
+    parser.add_argument("--save-baseline", help="이번 결과를 기준선으로 저장할 경로")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="허용 오차 비율")
+    args = parser.parse_args()
+
+    llm_options = {
+        "latency_ms": args.llm_latency_ms, "jitter": args.llm_jitter,
+        "completion_tokens": args.llm_completion_tokens, "rate_limit_rate": args.llm_rate_limit,
+        "embedding_latency_ms": args.embedding_latency_ms, "seed": args.seed,
+    }
+    report = run_benchmark(args.directory, workers=args.workers, chat_rounds=args.chat_rounds,
+                           chat_concurrency=args.chat_concurrency, llm_options=llm_options,
+                           weaviate_latency_ms=args.weaviate_latency_ms)
+    print(format_report(report))
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['stage']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"기준선 대비 성능 저하 없음 (허용 오차 {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
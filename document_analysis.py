@@ -0,0 +1,118 @@
+import functools
+import json
+import logging
+import os
+import re
+
+from keyword_classifier import UNCLASSIFIED
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gpt-4")
+ANALYSIS_MAX_TOKENS = int(os.getenv("ANALYSIS_MAX_TOKENS", "600"))
+ANALYSIS_MAX_KEY_FACTS = 8
+
+CATEGORIES = ["적금", "예금", "채권", "청년"]
+MBTI_TYPES = ["ISTJ", "ISFJ", "INFJ", "INTJ", "ISTP", "ISFP", "INFP", "INTP",
+              "ESTP", "ESFP", "ENFP", "ENTP", "ESTJ", "ESFJ", "ENFJ", "ENTJ"]
+
+# LLM 응답 JSON 스키마
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": CATEGORIES + [UNCLASSIFIED]},
+        "mbti": {"type": "string", "enum": MBTI_TYPES + [UNCLASSIFIED]},
+        "summary": {"type": "string"},
+        "key_facts": {"type": "array", "items": {"type": "string"}, "maxItems": ANALYSIS_MAX_KEY_FACTS},
+    },
+    "required": ["category", "mbti", "summary", "key_facts"],
+}
+
+ANALYSIS_PROMPT = (
+    "주어진 금융 상품 설명을 분석해 아래 형식의 JSON 객체 하나만 출력해 주세요. 다른 설명은 붙이지 마세요.\n"
+    '{"category": "적금|예금|채권|청년 중 하나", '
+    '"mbti": "이 상품에 가장 어울리는 MBTI 유형 (ISTJ, ISFJ, INFJ, INTJ, ISTP, ISFP, INFP, INTP, '
+    'ESTP, ESFP, ENFP, ENTP, ESTJ, ESFJ, ENFJ, ENTJ 중 하나)", '
+    '"summary": "이자율과 우대 조건만 간결하게 요약", '
+    f'"key_facts": ["가입 대상, 기간, 금액 한도 등 핵심 사실 (최대 {ANALYSIS_MAX_KEY_FACTS}개)"]}}\n'
+    f"판단할 수 없는 category나 mbti는 \"{UNCLASSIFIED}\"로 적어 주세요."
+)
+
+
+# jsonschema는 import 비용이 있어 처음 검증할 때 불러옴
+@functools.lru_cache(maxsize=None)
+def _validator():
+    from jsonschema import Draft7Validator
+    return Draft7Validator(ANALYSIS_SCHEMA)
+
+
+# LLM 분석 호출 자체가 실패한 경우 (rate limit, API 오류, 잘못된 응답 등)
+# 미지정/빈 요약으로 저장하지 않도록 호출한 쪽에 그대로 알린다.
+class DocumentAnalysisError(RuntimeError):
+    pass
+
+
+def empty_analysis():
+    return {"category": UNCLASSIFIED, "mbti": UNCLASSIFIED, "summary": "", "key_facts": []}
+
+
+# 응답 본문에서 JSON 객체 부분만 꺼냄 (```json 코드 블록이나 앞뒤 설명이 붙어 있어도 처리)
+def _extract_json(text):
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# 스키마에 맞지 않는 필드만 기본값으로 바꿔 나머지 필드는 살린다.
+def _normalize(data):
+    analysis = empty_analysis()
+    category = str(data.get("category") or "").strip()
+    if category in CATEGORIES:
+        analysis["category"] = category
+    mbti = str(data.get("mbti") or "").strip().upper()
+    if mbti in MBTI_TYPES:
+        analysis["mbti"] = mbti
+    if isinstance(data.get("summary"), str):
+        analysis["summary"] = data["summary"].strip()
+    key_facts = data.get("key_facts")
+    if isinstance(key_facts, str):
+        key_facts = [key_facts]
+    if isinstance(key_facts, list):
+        analysis["key_facts"] = [str(fact).strip() for fact in key_facts if str(fact).strip()][:ANALYSIS_MAX_KEY_FACTS]
+    return analysis
+
+
+# JSON이 아닌 "카테고리: ... / MBTI: ... / 요약: ..." 형식의 응답을 위한 대체 파서
+def _parse_free_text(text):
+    category_match = re.search(r"카테고리\W*(적금|예금|채권|청년)", text)
+    mbti_match = re.search(r"MBTI\W*(" + "|".join(MBTI_TYPES) + ")", text, re.IGNORECASE)
+    summary_match = re.search(r"요약\W*(.+)", text)
+    key_facts = [line.strip()[1:].strip() for line in text.splitlines() if line.strip()[:1] in ("-", "•", "*")]
+    return _normalize({
+        "category": category_match.group(1) if category_match else None,
+        "mbti": mbti_match.group(1) if mbti_match else None,
+        "summary": summary_match.group(1) if summary_match else "",
+        "key_facts": key_facts,
+    })
+
+
+# LLM 응답 문자열 -> {"category", "mbti", "summary", "key_facts"}
+# 스키마 검증을 통과하면 그대로 쓰고, 실패하면 필드별 정규화나 자유 형식 파서로 대체한다.
+def parse_analysis(text):
+    data = _extract_json(text or "")
+    if data is None:
+        logger.warning("분석 응답이 JSON이 아니어서 대체 파서를 사용합니다.")
+        return _parse_free_text(text or "")
+    errors = [error.message for error in _validator().iter_errors(data)]
+    if errors:
+        logger.warning(f"분석 응답이 스키마와 맞지 않아 필드별로 정리합니다: {errors[:3]}")
+    return _normalize(data)
+
+
+def analysis_messages(text):
+    return [{"role": "system", "content": ANALYSIS_PROMPT}, {"role": "user", "content": text}]
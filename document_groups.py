@@ -0,0 +1,132 @@
+import logging
+import math
+import os
+import uuid
+
+import numpy as np
+
+from vector_index import kmeans, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+GROUP_CLASS = "DocumentGroup"
+GROUP_FIELDS = ["group_id", "label", "category", "size"]
+# 기존 그룹에 합류시키는 최소 코사인 유사도와, 새 문서끼리 묶을 때 그룹 하나에 들어갈 평균 문서 수
+GROUP_SIMILARITY_THRESHOLD = float(os.getenv("GROUP_SIMILARITY_THRESHOLD", "0.8"))
+GROUP_TARGET_SIZE = int(os.getenv("GROUP_TARGET_SIZE", "4"))
+# 그룹 이름을 붙일 때 LLM에 보여 줄 대표 문서 수와 문서당 텍스트 길이
+GROUP_LABEL_SAMPLES = 5
+GROUP_LABEL_TEXT_CHARS = 200
+
+# 문서 그룹(DocumentGroup) 스키마: 벡터는 그룹 중심(정규화된 평균 임베딩)
+# 문서는 group_id 속성으로 소속 그룹을 가리킨다.
+GROUP_SCHEMA = {
+    "class": GROUP_CLASS,
+    "description": "Clusters of finance product documents",
+    "vectorizer": "none",
+    "properties": [
+        {"name": "group_id", "dataType": ["text"], "description": "Stable group identifier"},
+        {"name": "label", "dataType": ["text"], "description": "LLM-generated group name"},
+        {"name": "category", "dataType": ["text"], "description": "Most common category of the members"},
+        {"name": "size", "dataType": ["int"], "description": "Number of member documents"}
+    ]
+}
+GROUP_ID_PROPERTY = {"name": "group_id", "dataType": ["text"], "description": "DocumentGroup the document belongs to"}
+
+
+# 같은 group_id는 항상 같은 Weaviate UUID로 저장되도록 uuid5 사용
+def group_uuid(group_id):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{GROUP_CLASS}/{group_id}"))
+
+
+def new_group_id():
+    return f"group_{uuid.uuid4().hex[:12]}"
+
+
+# 증분 군집화
+# 새 문서 임베딩을 기존 그룹 중심과 한 번의 행렬곱으로 비교해 threshold 이상이면 가장 가까운 그룹에 넣고,
+# 어느 그룹과도 가깝지 않은 문서끼리는 spherical k-means로 새 그룹을 만든다.
+# 그룹 중심은 (중심 x 크기 + 새 문서 합)을 다시 정규화해 갱신하므로 기존 문서를 다시 읽지 않는다.
+class IncrementalClusterer:
+    def __init__(self, groups=None, threshold=GROUP_SIMILARITY_THRESHOLD, target_size=GROUP_TARGET_SIZE):
+        # groups: [{"group_id", "size", "vector", ...}, ...]
+        self.threshold = threshold
+        self.target_size = max(1, target_size)
+        self.groups = [dict(group) for group in groups or [] if group.get("vector")]
+        self.centroids = normalize_rows([group["vector"] for group in self.groups]) if self.groups else None
+
+    # vectors의 각 행이 들어간 group_id 목록과, 새로 만들어지거나 바뀐 그룹 목록을 반환
+    def assign(self, vectors):
+        vectors = normalize_rows(vectors)
+        count = len(vectors)
+        assignments = [None] * count
+        changed = {}
+
+        pending = np.ones(count, dtype=bool)
+        if self.centroids is not None and len(self.centroids):
+            similarities = vectors @ self.centroids.T
+            best = np.argmax(similarities, axis=1)
+            joined = similarities[np.arange(count), best] >= self.threshold
+            pending = ~joined
+            for index in np.flatnonzero(joined):
+                group = self.groups[best[index]]
+                assignments[index] = group["group_id"]
+                changed[group["group_id"]] = group
+            self._update_centroids(vectors[joined], best[joined])
+
+        created = 0
+        if pending.any():
+            rows = np.flatnonzero(pending)
+            k = max(1, math.ceil(len(rows) / self.target_size))
+            centroids, labels = kmeans(vectors[rows], k)
+            for cluster in range(len(centroids)):
+                members = rows[labels == cluster]
+                if not len(members):
+                    continue
+                group = {"group_id": new_group_id(), "size": len(members), "vector": centroids[cluster].tolist()}
+                self.groups.append(group)
+                changed[group["group_id"]] = group
+                created += 1
+                for index in members:
+                    assignments[index] = group["group_id"]
+            self.centroids = normalize_rows([group["vector"] for group in self.groups])
+
+        logger.info(f"{count}개 문서 군집화: 기존 그룹 합류 {count - int(pending.sum())}개, "
+                    f"새 그룹 {created}개")
+        return assignments, list(changed.values())
+
+    def _update_centroids(self, vectors, group_indexes):
+        if not len(vectors):
+            return
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, group_indexes, vectors)
+        counts = np.bincount(group_indexes, minlength=len(self.groups))
+        for index in np.flatnonzero(counts):
+            group = self.groups[index]
+            size = group.get("size") or 0
+            centroid = normalize_rows(self.centroids[index] * size + sums[index])[0]
+            self.centroids[index] = centroid
+            group["vector"] = centroid.tolist()
+            group["size"] = size + int(counts[index])
+
+
+# 그룹 구성원 중 가장 많은 카테고리
+def majority_category(categories):
+    counts = {}
+    for category in categories:
+        if category:
+            counts[category] = counts.get(category, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+
+# 새 그룹 이름을 붙이기 위한 LLM 메시지 (대표 문서 몇 개만 보여 줌)
+def group_label_messages(members):
+    samples = "\n".join(
+        f"- {member.get('filename')}: {(member.get('summary') or member.get('content') or '')[:GROUP_LABEL_TEXT_CHARS]}"
+        for member in members[:GROUP_LABEL_SAMPLES]
+    )
+    return [
+        {"role": "system", "content": "다음 금융 상품 문서들이 하나의 그룹으로 묶였습니다. "
+                                      "이 그룹을 설명하는 짧은 이름(20자 이내)만 출력해 주세요."},
+        {"role": "user", "content": samples}
+    ]
@@ -0,0 +1,24 @@
+import contextlib
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: 프로세스 간 lock 없이 동작
+    fcntl = None
+
+
+# 여러 프로세스(Streamlit 앱, ingest.py 등)가 같은 색인 파일을 고칠 때 읽기-수정-쓰기를 직렬화
+# path 옆의 .lock 파일에 배타적 flock을 건다. 같은 프로세스의 다른 스레드끼리도 서로 기다린다.
+@contextlib.contextmanager
+def file_lock(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,292 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import unicodedata
+
+from document_analysis import DocumentAnalysisError
+from keyword_classifier import UNCLASSIFIED
+from pdf_extraction import ExtractionPool, extract_pdfs, join_pages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIR = os.getenv("INGEST_DATA_DIR", "신한은행_데이터")
+DEFAULT_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", os.path.join(".cache", "ingest_manifest.json"))
+# 한 번에 커밋(Weaviate 저장 + checkpoint 기록)하는 문서 수와 단계 사이 큐 크기
+DEFAULT_COMMIT_SIZE = int(os.getenv("INGEST_COMMIT_SIZE", "8"))
+DEFAULT_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# macOS에서 복사된 한글 디렉터리 이름은 NFD로 저장되어 있을 수 있으므로 두 형태를 모두 시도
+def resolve_directory(directory):
+    for form in ("NFC", "NFD"):
+        candidate = unicodedata.normalize(form, directory)
+        if os.path.isdir(candidate):
+            return candidate
+    return directory
+
+
+# 디렉터리 아래 PDF 파일을 {상대 경로: 절대 경로}로 수집
+def scan_pdfs(directory):
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, directory)] = path
+    return files
+
+
+# manifest: {상대 경로: {"sha256": 파일 해시, "object_ids": [Weaviate 문서, 페이지, 조각 ID, ...]}}
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"manifest를 읽을 수 없어 새로 만듭니다 ({path}): {e}")
+        return {}
+
+
+def save_manifest(manifest, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# manifest에 기록된 문서 ID로 해당 파일의 문서(와 조각)를 삭제
+# RAG는 import 시 Weaviate 연결, 캐시, 메트릭 서버를 준비하므로 함수 안에서 import한다.
+# spawn으로 띄운 PDF 추출 워커는 이 모듈을 __mp_main__으로 다시 import하기 때문이다.
+def delete_manifest_objects(entry):
+    import RAG
+
+    object_ids = [object_id for object_id in entry.get("object_ids", []) if object_id]
+    if not object_ids:
+        return 0
+    return RAG.delete_documents_where({"path": ["id"], "operator": "ContainsAny", "valueTextArray": object_ids})
+
+
+_DONE = object()
+
+
+# 생성기를 별도 스레드에서 돌리고 결과를 크기가 제한된 큐로 넘김
+# 다음 단계가 느리면 큐가 차서 앞 단계가 기다리므로, 메모리에는 처리 중인 문서만 남는다.
+def threaded(generator, maxsize=DEFAULT_QUEUE_SIZE):
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in generator:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+# 1단계: PDF 추출 (워커 수만큼 파일씩 같은 프로세스 풀에서 처리) -> (상대 경로, 본문 또는 None)
+def extract_stage(relpaths, files, pool):
+    window = pool.workers
+    for start in range(0, len(relpaths), window):
+        pdf_files = []
+        for relpath in relpaths[start:start + window]:
+            with open(files[relpath], "rb") as f:
+                pdf_files.append((relpath, f.read()))
+        for relpath, pages in extract_pdfs(pdf_files, pool=pool):
+            yield relpath, None if pages is None else join_pages(pages)
+
+
+# 2단계: 전처리 + 분류 -> (상대 경로, Weaviate 데이터 객체 또는 None)
+# batch_size개 문서씩 키워드 분류기로 한 번에 분류해 두고, LLM 분석이 카테고리를 정하지 못한
+# 문서(미지정)에는 키워드 분류 결과를 쓴다. LLM 분석 호출이 실패한 문서는 None으로 넘겨
+# 빈 분석 결과로 저장되거나 manifest에 기록되지 않게 한다.
+def classify_stage(extracted, batch_size=DEFAULT_COMMIT_SIZE):
+    import RAG
+
+    for batch in batched(extracted, max(1, batch_size)):
+        keyword_results = iter(RAG.classify_products([content for _, content in batch if content is not None]))
+        for relpath, content in batch:
+            if content is None:
+                yield relpath, None
+                continue
+            keyword_category = next(keyword_results)["category"]
+            try:
+                data_object = RAG.classify_document(relpath, content, RAG.preprocess_text(content))
+            except DocumentAnalysisError as e:
+                logger.error(f"{relpath} 분석 실패, 다음 실행에서 다시 시도합니다: {e}")
+                yield relpath, None
+                continue
+            if data_object["category"] == UNCLASSIFIED:
+                data_object["category"] = keyword_category
+            yield relpath, data_object
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# 3단계: commit_size개씩 Weaviate에 저장하고, 저장이 끝난 파일만 manifest(checkpoint)에 기록
+# 바뀐 파일은 새 버전을 먼저 저장하고, 전부 저장된 뒤에만 이전 버전의 객체를 UUID로 삭제한다.
+# 저장이 일부라도 실패하면 이번에 저장된 객체를 지우고 이전 버전과 manifest를 그대로 둔다.
+def commit_batch(batch, manifest, hashes, stats):
+    import RAG
+
+    queued, previous = {}, {}
+    with RAG.new_batch_writer() as writer:
+        for relpath, data_object in batch:
+            if data_object is None:
+                # 추출 또는 분석 실패: manifest를 갱신하지 않아 다음 실행에서 다시 시도
+                stats["failed"] += 1
+                continue
+            try:
+                if relpath in manifest:
+                    # 예전 manifest에는 문서 ID만 있으므로 페이지/조각 ID는 파일명으로 조회
+                    previous[relpath] = set(manifest[relpath].get("object_ids", [])) | set(RAG.file_object_ids(relpath))
+                queued[relpath] = RAG.write_document(data_object, writer)
+            except Exception as e:
+                # 임베딩 등이 실패하면 문서를 저장하지 않고 manifest도 갱신하지 않음 (다음 실행에서 다시 시도)
+                logger.error(f"{relpath} 저장 실패: {e}")
+                stats["failed"] += 1
+
+    # 문서, 페이지, 조각 중 하나라도 저장되지 않은 파일은 manifest를 갱신하지 않음 (다음 실행에서 다시 시도)
+    failed_ids = {failure["uuid"] for failure in writer.failed}
+    for relpath, object_ids in queued.items():
+        if failed_ids.intersection(object_ids):
+            delete_objects(relpath, set(object_ids) - failed_ids)
+            stats["failed"] += 1
+            continue
+        old_ids = previous.get(relpath, set()) - set(object_ids)
+        # 이전 버전을 지우지 못하면 ID를 manifest에 남겨 다음 갱신이나 삭제 때 함께 지움
+        if old_ids and not delete_objects(relpath, old_ids):
+            object_ids = object_ids + sorted(old_ids)
+        manifest[relpath] = {"sha256": hashes[relpath], "object_ids": object_ids}
+        stats["committed"] += 1
+
+
+def delete_objects(relpath, object_ids):
+    import RAG
+
+    try:
+        RAG.delete_objects(object_ids)
+        return True
+    except Exception as e:
+        logger.error(f"{relpath} 객체 삭제 실패: {e}")
+        return False
+
+
+# 디렉터리 증분 적재 파이프라인
+# 해시가 바뀌었거나 새로 생긴 PDF만 추출 -> 분류 -> 저장 단계로 흘려보내고, 사라진 PDF의 문서는 삭제한다.
+# 각 단계는 크기 제한 큐로 연결된 생성기이며, commit_size개 문서를 저장할 때마다 manifest를
+# checkpoint로 기록한다. 중간에 중단되면 다시 실행할 때 마지막 checkpoint 이후 파일만 처리한다.
+# 변경이 없으면 LLM 호출 없이 해시 계산만으로 끝난다. 파일 이름은 디렉터리 기준 상대 경로로 저장된다.
+def ingest_directory(directory=DEFAULT_DATA_DIR, manifest_path=DEFAULT_MANIFEST_PATH, workers=None,
+                     dry_run=False, commit_size=DEFAULT_COMMIT_SIZE, queue_size=DEFAULT_QUEUE_SIZE):
+    directory = resolve_directory(directory)
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"디렉터리를 찾을 수 없습니다: {directory}")
+    manifest = load_manifest(manifest_path)
+    files = scan_pdfs(directory)
+    hashes = {relpath: file_sha256(path) for relpath, path in files.items()}
+
+    changed = [relpath for relpath, sha in hashes.items() if manifest.get(relpath, {}).get("sha256") != sha]
+    removed = [relpath for relpath in manifest if relpath not in files]
+    stats = {
+        "added": sum(1 for relpath in changed if relpath not in manifest),
+        "updated": sum(1 for relpath in changed if relpath in manifest),
+        "removed": len(removed),
+        "unchanged": len(files) - len(changed),
+        "committed": 0,
+        "failed": 0,
+    }
+    logger.info(f"{directory}: {stats}")
+    if dry_run:
+        return stats
+
+    import RAG
+
+    # 스키마 없이 저장하면 auto-schema가 page_number를 number로 만들어 페이지 조회 필터가 실패함
+    if not RAG.create_weaviate_schema():
+        raise RuntimeError("Weaviate 스키마를 만들 수 없습니다.")
+
+    for relpath in removed:
+        delete_manifest_objects(manifest.pop(relpath))
+        save_manifest(manifest, manifest_path)
+
+    # 실행 전체에서 추출 워커 프로세스 한 벌을 재사용
+    with ExtractionPool(workers) as pool:
+        extracted = threaded(extract_stage(changed, files, pool), maxsize=queue_size)
+        classified = threaded(classify_stage(extracted, batch_size=commit_size), maxsize=queue_size)
+        for batch in batched(classified, max(1, commit_size)):
+            commit_batch(batch, manifest, hashes, stats)
+            save_manifest(manifest, manifest_path)
+            logger.info(f"checkpoint 저장: {stats['committed']}/{len(changed)}개 파일 완료")
+
+    logger.info(f"{directory} 적재 완료: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 디렉터리를 Weaviate에 증분 적재합니다.")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--commit-size", type=int, default=DEFAULT_COMMIT_SIZE,
+                        help="저장과 checkpoint 기록 단위가 되는 문서 수")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="단계 사이 큐에 대기할 수 있는 최대 문서 수")
+    parser.add_argument("--dry-run", action="store_true", help="변경 사항만 계산하고 적재하지 않음")
+    args = parser.parse_args()
+
+    stats = ingest_directory(args.directory, manifest_path=args.manifest, workers=args.workers,
+                             dry_run=args.dry_run, commit_size=args.commit_size, queue_size=args.queue_size)
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
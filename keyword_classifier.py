@@ -0,0 +1,86 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+UNCLASSIFIED = "미지정"
+
+# Keywords and weights
+CATEGORY_KEYWORDS = {
+    '채권': {
+        'words': [
+            '채권', '국채', '회사채', '신용등급', '발행자', '거치 기간', '유동성',
+            '표면 이율', '발행기관', '발행금액', '수익률', '발행일', '할인 채권',
+            '채권 시장', '투자 등급', '기간 채권', '만기 채권', '국내 채권',
+            '해외 채권', '채권 펀드', '장기 채권', '단기 채권', '채권 등급'
+        ],
+        'weight': 5
+    },
+    '적금': {
+        'words': ['적금', '저축', '월 적립', '자동 이체', '정기', '납입', '출금 제한'],
+        'weight': 5
+    },
+    '예금': {
+        'words': ['예금', '정기예금', '거치', '이자', '파킹 통장', '단리', '복리', '고정 금리', '변동 금리'],
+        'weight': 5
+    },
+    '청년': {
+        'words': ['청년', '청년내일저축계좌', '청년도약계좌', '청년희망적금'],
+        'weight': 8
+    }
+}
+
+
+# 키워드 기반 상품 분류기
+# 키워드 표 전체를 한 번만 하나의 정규식으로 컴파일하고, 텍스트를 한 번만 훑는다.
+# 모든 위치에서 lookahead로 가장 긴 키워드를 찾고, 그 키워드의 접두사인 짧은 키워드도
+# 함께 찾은 것으로 처리하므로 겹치는 키워드('청년'과 '청년도약계좌')도 모두 집계된다.
+# 한글 사이에서 동작하지 않는 \b 경계 대신 부분 문자열 일치를 사용한다.
+class KeywordClassifier:
+    def __init__(self, keywords=CATEGORY_KEYWORDS):
+        self.categories = list(keywords)
+        self._targets = {}
+        for category, data in keywords.items():
+            for word in data['words']:
+                self._targets.setdefault(word.lower(), []).append((category, data['weight']))
+
+        words = sorted(self._targets, key=len, reverse=True)
+        self._prefixes = {
+            word: [other for other in words if other != word and word.startswith(other)]
+            for word in words
+        }
+        self._pattern = re.compile("(?=(" + "|".join(re.escape(word) for word in words) + "))", re.IGNORECASE)
+
+    # 텍스트에 등장한 키워드 집합
+    def matched_keywords(self, text):
+        found = set()
+        for match in self._pattern.finditer(text):
+            word = match.group(1).lower()
+            if word not in found:
+                found.add(word)
+                found.update(self._prefixes[word])
+        return found
+
+    # 카테고리별 점수 (키워드마다 한 번씩 가중치를 더함)
+    def scores(self, text):
+        category_scores = {category: 0 for category in self.categories}
+        for word in self.matched_keywords(text or ""):
+            for category, weight in self._targets[word]:
+                category_scores[category] += weight
+        return category_scores
+
+    @staticmethod
+    def top_category(category_scores):
+        top_category, top_score = max(category_scores.items(), key=lambda item: item[1])
+        return top_category if top_score > 0 else UNCLASSIFIED
+
+    def classify(self, text):
+        return self.top_category(self.scores(text))
+
+    # 여러 텍스트를 한 번에 분류: [{"category": 최고 점수 카테고리, "scores": 카테고리별 점수}, ...]
+    def classify_many(self, texts):
+        results = []
+        for text in texts:
+            category_scores = self.scores(text)
+            results.append({"category": self.top_category(category_scores), "scores": category_scores})
+        return results
@@ -0,0 +1,222 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(".cache", "lexical_index.json"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+HANGUL_RE = re.compile(r'[가-힣]')
+
+
+# 한국어 대응 토큰화: preprocess_text 결과를 공백으로 나눈 뒤,
+# 각 어절 전체와 (한글이 포함된 경우) 글자 bigram을 함께 색인한다.
+# 조사가 붙은 어절('청년도약계좌를')도 bigram으로 '청년도약계좌'와 매칭된다.
+def tokenize(text):
+    tokens = []
+    for word in text.lower().split():
+        tokens.append(word)
+        if len(word) > 1 and HANGUL_RE.search(word):
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+# 문서 조각 식별자: Weaviate 객체 UUID
+# 관리자 업로드는 여러 PDF를 같은 파일명으로 저장할 수 있으므로 (filename, chunk_index)는 겹칠 수 있다.
+# UUID가 없는 레코드(예전 색인 파일)만 (filename, chunk_index)로 구분한다.
+def chunk_id(record):
+    object_id = record.get("id") or (record.get("_additional") or {}).get("id")
+    if object_id:
+        return str(object_id)
+    return f"{record.get('filename')}#{record.get('chunk_index', 0)}"
+
+
+# BM25 역색인
+# 문서 조각 단위로 색인하며 add/remove로 증분 갱신된다. 키는 chunk_id (Weaviate 객체 UUID).
+# 마지막 저장 이후의 변경은 journal에 남겨 두고, 저장할 때 다른 프로세스가 그 사이 파일을 바꿨으면
+# file lock 안에서 최신 파일을 다시 읽고 journal을 다시 적용한 뒤 저장한다.
+class BM25Index:
+    def __init__(self, path=LEXICAL_INDEX_PATH, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._postings = defaultdict(dict)
+        self._total_length = 0
+        self._journal = []
+        self._mtime = None
+        # 마지막 저장 이후 바뀐 내용이 있는지
+        self.dirty = False
+        self._load()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        self._clear()
+        self._mtime = self._file_mtime()
+        if self._mtime is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                docs = json.load(f)
+            for key, doc in docs.items():
+                self._insert(key, doc["record"], Counter(doc["tf"]))
+            logger.info(f"BM25 인덱스 로드: {len(self._docs)}개 조각")
+        except Exception as e:
+            logger.error(f"BM25 인덱스를 불러올 수 없습니다: {e}")
+            self._clear()
+
+    def save(self):
+        with self._lock, file_lock(self.path):
+            if self._file_mtime() != self._mtime:
+                journal = self._journal
+                self._load()
+                self._replay(journal)
+            docs = {key: {"record": doc["record"], "tf": doc["tf"]} for key, doc in self._docs.items()}
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(docs, f, ensure_ascii=False)
+            os.replace(self.path + ".tmp", self.path)
+            self._mtime = self._file_mtime()
+            self._journal = []
+            self.dirty = False
+
+    def _replay(self, journal):
+        for operation, *arguments in journal:
+            if operation == "add":
+                self._add(*arguments)
+            elif operation == "remove":
+                self._remove(*arguments)
+            elif operation == "remove_ids":
+                self._remove_ids(*arguments)
+            else:
+                self._clear()
+
+    def _insert(self, key, record, tf):
+        length = sum(tf.values())
+        self._docs[key] = {"record": record, "tf": dict(tf), "length": length}
+        for term, count in tf.items():
+            self._postings[term][key] = count
+        self._total_length += length
+
+    def _delete(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for term in doc["tf"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= doc["length"]
+
+    def _add(self, key, record, tf):
+        self._delete(key)
+        self._insert(key, record, tf)
+
+    def _remove(self, filename):
+        keys = [key for key, doc in self._docs.items() if doc["record"].get("filename") == filename]
+        for key in keys:
+            self._delete(key)
+        return len(keys)
+
+    def _remove_ids(self, ids):
+        keys = [key for key in ids if key in self._docs]
+        for key in keys:
+            self._delete(key)
+        return len(keys)
+
+    def _clear(self):
+        self._docs, self._postings, self._total_length = {}, defaultdict(dict), 0
+
+    def _record(self, *operation):
+        self._journal.append(operation)
+        self.dirty = True
+
+    # record: 조각 메타데이터(dict), text: preprocess_text를 거친 조각 본문
+    def add(self, record, text):
+        key, record, tf = chunk_id(record), dict(record), Counter(tokenize(text))
+        with self._lock:
+            self._add(key, record, tf)
+            self._record("add", key, record, tf)
+
+    # 다른 프로세스가 같은 파일의 조각을 추가했을 수 있으므로 지운 것이 없어도 journal에 남긴다.
+    def remove(self, filename):
+        with self._lock:
+            self._record("remove", filename)
+            return self._remove(filename)
+
+    # 조각 UUID로 삭제 (같은 파일명으로 새로 저장된 조각은 남음)
+    def remove_ids(self, ids):
+        ids = [str(object_id) for object_id in ids]
+        with self._lock:
+            self._record("remove_ids", ids)
+            return self._remove_ids(ids)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._record("clear")
+
+    def search(self, query, k=5, mbti_type=None, category=None):
+        with self._lock:
+            if not self._docs:
+                return []
+            count = len(self._docs)
+            average_length = self._total_length / count or 1.0
+            scores = defaultdict(float)
+            for term, query_tf in Counter(tokenize(query)).items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    length = self._docs[key]["length"]
+                    denominator = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[key] += query_tf * idf * tf * (self.k1 + 1) / denominator
+
+            results = []
+            for key, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                record = self._docs[key]["record"]
+                if mbti_type and record.get("mbti") != mbti_type:
+                    continue
+                if category and record.get("category") != category:
+                    continue
+                results.append(dict(record, score=score))
+                if len(results) >= k:
+                    break
+            return results
+
+
+# Reciprocal rank fusion: 순위 기반으로 두 결과 목록을 합친다.
+# lexical_weight는 BM25 순위의 비중(0이면 벡터 결과만, 1이면 BM25 결과만).
+def reciprocal_rank_fusion(vector_results, lexical_results, lexical_weight=0.5, k=None, rrf_k=RRF_K):
+    fused = {}
+    for weight, results in ((1 - lexical_weight, vector_results), (lexical_weight, lexical_results)):
+        if weight <= 0:
+            continue
+        for rank, result in enumerate(results, start=1):
+            key = chunk_id(result)
+            entry = fused.setdefault(key, {"result": result, "score": 0.0})
+            entry["score"] += weight / (rrf_k + rank)
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    if k is not None:
+        ranked = ranked[:k]
+    return [dict(entry["result"], score=entry["score"]) for entry in ranked]
@@ -0,0 +1,239 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import openai
+
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# 계정 한도 (분당 토큰 수, 분당 요청 수)와 재시도 설정 (환경 변수로 조정 가능)
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "10000"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "1"))
+LLM_RETRY_MAX = float(os.getenv("LLM_RETRY_MAX", "30"))
+
+# 우선순위 (숫자가 작을수록 먼저 처리): 사용자 대화 > 문서 적재/그룹화 같은 대량 작업
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# 재시도할 만한 일시적 오류
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
+
+# 재시도 대기 시간: 응답 헤더의 retry-after가 있으면 따르고, 없으면 full jitter 지수 backoff
+def retry_delay(attempt, error, base=LLM_RETRY_BASE, maximum=LLM_RETRY_MAX):
+    delay = random.uniform(0, min(maximum, base * (2 ** attempt)))
+    headers = getattr(error, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            delay = max(delay, float(headers["retry-after-ms"]) / 1000)
+        elif headers.get("retry-after"):
+            delay = max(delay, float(headers["retry-after"]))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+# 프롬프트 + 응답 토큰 수 추정
+# 토크나이저 없이 계산: ASCII는 4글자당 1토큰, 한글 등 그 외 문자는 글자당 1토큰, 메시지당 4토큰을 더한다.
+def estimate_tokens(messages, max_tokens=None):
+    tokens = 0
+    for message in messages or []:
+        content = message.get("content") or ""
+        ascii_chars = sum(1 for char in content if ord(char) < 128)
+        tokens += 4 + ascii_chars // 4 + (len(content) - ascii_chars)
+    return tokens + (max_tokens or 0)
+
+
+# 분당 한도를 초당 비율로 채워 넣는 토큰 버킷
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # amount만큼 쓸 수 있을 때까지 기다려야 하는 시간(초)
+    # 버킷 크기보다 큰 요청은 버킷이 가득 찼을 때 보낸다.
+    def wait_time(self, amount, now):
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    # 실제 사용량과 추정치의 차이를 반영할 때는 음수/초과도 허용
+    def consume(self, amount):
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+# 모든 OpenAI ChatCompletion 호출이 거쳐 가는 스케줄러
+# - TPM/RPM 토큰 버킷: 요청마다 추정 토큰을 미리 차감하고, 응답의 usage로 차이를 보정한다.
+# - 우선순위 대기열: 한도에 걸려 기다리는 동안 대화 요청이 대량 작업보다 먼저 나간다. (같은 등급은 도착 순)
+# - 일시적 오류는 jitter를 준 지수 backoff로 재시도하고, 429를 받으면 모든 요청을 잠시 멈춰 연쇄 429를 막는다.
+# - 진행 중인 요청과 같은 (stream이 아닌) 요청은 새로 보내지 않고 그 결과를 함께 받는다.
+class LLMScheduler:
+    def __init__(self, tokens_per_minute=LLM_TOKENS_PER_MINUTE, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 max_retries=LLM_MAX_RETRIES, retry_base=LLM_RETRY_BASE, retry_max=LLM_RETRY_MAX, create=None):
+        self.max_retries = max(0, max_retries)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._create = create or openai.ChatCompletion.create
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._requests = TokenBucket(requests_per_minute)
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "coalesced": 0, "tokens": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    # 우선순위 순서가 되고 버킷에 여유가 생길 때까지 대기한 뒤 추정 토큰을 차감
+    def _acquire(self, priority, tokens):
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == ticket:
+                        now = time.monotonic()
+                        timeout = max(self._paused_until - now, self._tokens.wait_time(tokens, now),
+                                      self._requests.wait_time(1, now))
+                        if timeout <= 0:
+                            heapq.heappop(self._waiting)
+                            self._tokens.consume(tokens)
+                            self._requests.consume(1)
+                            self._condition.notify_all()
+                            return
+                    self._condition.wait(timeout)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                raise
+
+    def _adjust(self, tokens):
+        with self._condition:
+            self._tokens.consume(tokens)
+            self._condition.notify_all()
+
+    def _pause(self, seconds):
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _retry_delay(self, attempt, error):
+        return retry_delay(attempt, error, base=self.retry_base, maximum=self.retry_max)
+
+    # 대기열 대기 시간(llm_queue_wait)과 재시도를 포함한 전체 호출 시간(llm_call)을 측정
+    def _call(self, priority, kwargs):
+        model = kwargs.get("model")
+        with metrics.span("llm_call", model=model) as span:
+            response, attempts, usage = self._call_with_retries(priority, kwargs, model)
+            span.set(retries=attempts - 1, **usage)
+        return response
+
+    def _call_with_retries(self, priority, kwargs, model):
+        estimate = estimate_tokens(kwargs.get("messages"), kwargs.get("max_tokens"))
+        for attempt in range(self.max_retries + 1):
+            with metrics.span("llm_queue_wait", model=model):
+                self._acquire(priority, estimate)
+            try:
+                response = self._create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                # 거절된 요청은 한도에 포함되지 않으므로 차감한 토큰을 돌려줌
+                self._adjust(-estimate)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                self._count("retries")
+                metrics.count("llm_retries_total", model=model, error=type(e).__name__)
+                if isinstance(e, openai.error.RateLimitError):
+                    self._count("rate_limited")
+                    self._pause(delay)
+                logger.warning(f"LLM 요청 실패 ({type(e).__name__}), {delay:.1f}초 후 재시도 "
+                               f"{attempt + 1}/{self.max_retries}: {e}")
+                time.sleep(delay)
+                continue
+
+            self._count("requests")
+            metrics.count("llm_requests_total", model=model)
+            usage = {} if kwargs.get("stream") else (response.get("usage") or {})
+            used = usage.get("total_tokens")
+            if used is not None:
+                self._adjust(used - estimate)
+            self._count("tokens", used if used is not None else estimate)
+            if used is not None:
+                usage = {"prompt_tokens": usage.get("prompt_tokens", 0),
+                         "completion_tokens": usage.get("completion_tokens", 0)}
+                metrics.count("llm_tokens_total", usage["prompt_tokens"], model=model, kind="prompt")
+                metrics.count("llm_tokens_total", usage["completion_tokens"], model=model, kind="completion")
+            else:
+                # 스트리밍 응답은 usage가 없으므로 추정치로 기록
+                usage = {"estimated_tokens": estimate}
+                metrics.count("llm_tokens_total", estimate, model=model, kind="estimated")
+            return response, attempt + 1, usage
+
+    @staticmethod
+    def _coalesce_key(kwargs):
+        payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # openai.ChatCompletion.create와 같은 인자로 호출
+    def chat_completion(self, priority=PRIORITY_INTERACTIVE, **kwargs):
+        key = self._coalesce_key(kwargs)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            self._count("coalesced")
+            return future.result()
+
+        try:
+            response = self._call(priority, kwargs)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    # 스트리밍 응답: 토큰이 도착하는 대로 텍스트 조각을 반환 (재시도는 첫 응답을 받기 전까지만)
+    def stream_chat_completion(self, priority=PRIORITY_INTERACTIVE, **kwargs):
+        response = self._call(priority, dict(kwargs, stream=True))
+        for chunk in response:
+            content = chunk.choices[0].get("delta", {}).get("content")
+            if content:
+                yield content
@@ -0,0 +1,334 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 꺼져 있으면(기본값) span/count/trace가 바로 반환되어 측정 비용이 거의 없다.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+# 요청별 trace를 JSON lines로 기록할 파일 (빈 값이면 메모리에만 보관), Prometheus /metrics 포트 (0이면 사용 안 함)
+METRICS_TRACE_PATH = os.getenv("METRICS_TRACE_PATH", os.path.join(".cache", "traces.jsonl"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# 기본은 로컬에서만 접근 가능 (외부 Prometheus가 수집해야 하면 0.0.0.0 등으로 지정)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_RECENT_TRACES = int(os.getenv("METRICS_RECENT_TRACES", "100"))
+
+PREFIX = "pm_"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SPAN_METRIC = "span_duration_seconds"
+# trace 안에서 남긴 로그에 query_id를 붙이는 로그 포맷 (trace 밖이면 "-")
+LOG_FORMAT = "%(levelname)s:%(name)s:[%(query_id)s] %(message)s"
+
+METRIC_HELP = {
+    SPAN_METRIC: "Duration of instrumented stages (pdf_extraction, preprocess, llm_call, embedding, weaviate_request)",
+    "span_errors_total": "Instrumented stages that raised an exception",
+    "pdf_pages_total": "Pages extracted from PDF files",
+    "llm_requests_total": "Chat completion requests sent upstream",
+    "llm_retries_total": "Chat completion retries after transient errors",
+    "llm_tokens_total": "Chat completion tokens (usage from the response, estimated for streams)",
+    "embedding_texts_total": "Texts sent to the embedding API",
+    "embedding_retries_total": "Embedding requests retried after transient errors",
+    "weaviate_errors_total": "Weaviate requests that failed or returned 502/503/504",
+    "weaviate_objects_total": "Objects written through the Weaviate batch writer",
+    "queries_total": "Chat queries by route",
+}
+
+# 현재 요청의 trace (스레드/코루틴마다 따로 유지)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class _NoopSpan:
+    query_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# 시간 측정 구간: 끝나면 duration histogram에 기록하고, 진행 중인 trace가 있으면 trace에도 추가
+# labels는 Prometheus label(값의 종류가 적은 것만), set()으로 넣은 값은 trace에만 기록된다.
+class Span:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.attributes = {}
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter() - self.started
+        labels = dict(self.labels, span=self.name)
+        self.registry.observe(SPAN_METRIC, duration, **labels)
+        if exc_type is not None:
+            self.registry.count("span_errors_total", **labels)
+            self.attributes["error"] = exc_type.__name__
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(self, duration)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+# 요청 하나(대화 질의 등)의 span 목록. query_id로 로그/메시지와 연결한다.
+class Trace:
+    def __init__(self, registry, name, query_id=None, **attributes):
+        self.registry = registry
+        self.name = name
+        self.query_id = query_id or uuid.uuid4().hex
+        self.attributes = attributes
+        self.spans = []
+        self.started = None
+        self._token = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self._token = _current_trace.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _current_trace.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.registry.finish_trace(self, time.perf_counter() - self.started)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_span(self, span, duration):
+        with self._lock:
+            self.spans.append({
+                "name": span.name,
+                "offset_ms": round((span.started - self.started) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                **{key: value for key, value in span.labels.items() if value is not None},
+                **span.attributes,
+            })
+
+    def to_dict(self, duration):
+        return {
+            "query_id": self.query_id,
+            "name": self.name,
+            "timestamp": self.started_at,
+            "duration_ms": round(duration * 1000, 3),
+            **self.attributes,
+            "spans": self.spans,
+        }
+
+
+# 카운터, histogram, 요청별 trace 저장소
+class MetricsRegistry:
+    def __init__(self, enabled=METRICS_ENABLED, trace_path=METRICS_TRACE_PATH, recent_traces=METRICS_RECENT_TRACES,
+                 buckets=DURATION_BUCKETS):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.buckets = tuple(buckets)
+        self.recent_traces = deque(maxlen=recent_traces)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, labels)
+
+    def trace(self, name, query_id=None, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Trace(self, name, query_id=query_id, **attributes)
+
+    def count(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def finish_trace(self, trace, duration):
+        record = trace.to_dict(duration)
+        self.recent_traces.append(record)
+        if not self.trace_path:
+            return
+        try:
+            with self._trace_lock:
+                directory = os.path.dirname(self.trace_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.trace_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"trace를 기록할 수 없습니다 ({self.trace_path}): {e}")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        self.recent_traces.clear()
+
+    def _snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+                          for key, value in self._histograms.items()}
+        return counters, histograms
+
+    # Prometheus text exposition format (0.0.4)
+    def prometheus_text(self):
+        counters, histograms = self._snapshot()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {PREFIX}{name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {PREFIX}{name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    # 현재 값 전체를 JSON lines로 (한 줄에 metric 하나)
+    def json_lines(self):
+        counters, histograms = self._snapshot()
+        timestamp = time.time()
+        lines = []
+        for (name, labels), value in sorted(counters.items()):
+            lines.append({"timestamp": timestamp, "type": "counter", "name": PREFIX + name,
+                          "labels": dict(labels), "value": value})
+        for (name, labels), histogram in sorted(histograms.items()):
+            lines.append({"timestamp": timestamp, "type": "histogram", "name": PREFIX + name,
+                          "labels": dict(labels), "count": histogram["count"], "sum": histogram["sum"],
+                          "buckets": dict(zip(map(str, self.buckets), histogram["buckets"]))})
+        return "\n".join(json.dumps(line, ensure_ascii=False) for line in lines) + ("\n" if lines else "")
+
+    def export(self, path, fmt="prometheus"):
+        text = self.json_lines() if fmt == "jsonl" else self.prometheus_text()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a" if fmt == "jsonl" else "w", encoding="utf-8") as f:
+            f.write(text)
+
+    # /metrics (Prometheus), /metrics.jsonl, /traces (최근 trace) 를 제공하는 HTTP 서버
+    def start_http_server(self, port=METRICS_PORT, host=METRICS_HOST):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.prometheus_text(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.jsonl":
+                    body, content_type = registry.json_lines(), "application/x-ndjson"
+                elif self.path == "/traces":
+                    body, content_type = json.dumps(list(registry.recent_traces), ensure_ascii=False), \
+                        "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"metrics 서버 시작: http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+
+# 프로세스 전체가 공유하는 registry (각 모듈은 metrics.registry.span(...) 형태로 사용)
+registry = MetricsRegistry()
+
+
+# 현재 trace의 query_id (trace 밖이거나 측정이 꺼져 있으면 None)
+def current_query_id():
+    trace = _current_trace.get()
+    return trace.query_id if trace is not None else None
+
+
+# 로그 레코드에 현재 query_id를 넣는 필터
+class QueryIdFilter(logging.Filter):
+    def filter(self, record):
+        record.query_id = current_query_id() or "-"
+        return True
+
+
+query_id_filter = QueryIdFilter()
+
+
+# 루트 로거의 handler에 query_id 필터와 포맷을 적용해 로그와 /traces의 trace를 query_id로 연결
+# 같은 필터 객체를 쓰므로 여러 번 호출해도 필터가 중복되지 않는다.
+def link_logs_to_traces(log_format=LOG_FORMAT):
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(query_id_filter)
+        handler.setFormatter(logging.Formatter(log_format))
@@ -0,0 +1,303 @@
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# 워커 프로세스 수, 파일당 제한 시간(초), 작업 하나가 맡는 최대 페이지 수
+DEFAULT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+DEFAULT_FILE_TIMEOUT = float(os.getenv("PDF_EXTRACT_TIMEOUT", "120"))
+DEFAULT_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", os.path.join(".cache", "page_cache.sqlite3"))
+
+# 문서 본문에서 페이지 경계를 나타내는 구분자 (form feed)
+PAGE_SEPARATOR = "\f"
+
+
+def join_pages(pages):
+    return PAGE_SEPARATOR.join(page or "" for page in pages)
+
+
+def split_pages(content):
+    return (content or "").split(PAGE_SEPARATOR)
+
+
+# 페이지별 추출 결과 디스크 캐시: (파일 해시, 페이지 번호) -> 텍스트
+# 같은 PDF를 다시 적재하거나 조각 나누기를 바꿔 실험할 때 PDF 파싱을 건너뛴다.
+class PageCache:
+    def __init__(self, path=PAGE_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS files (file_hash TEXT PRIMARY KEY, page_count INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "file_hash TEXT NOT NULL, page_number INTEGER NOT NULL, text TEXT NOT NULL, "
+            "PRIMARY KEY (file_hash, page_number))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def file_hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    # 모든 페이지가 캐시에 있을 때만 페이지 목록을 반환
+    def get_pages(self, file_hash):
+        with self._lock:
+            row = self._conn.execute("SELECT page_count FROM files WHERE file_hash = ?", (file_hash,)).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT text FROM pages WHERE file_hash = ? ORDER BY page_number", (file_hash,)
+            ).fetchall()
+        if len(rows) != row[0]:
+            return None
+        return [text for (text,) in rows]
+
+    def put_pages(self, file_hash, pages):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE file_hash = ?", (file_hash,))
+            self._conn.executemany(
+                "INSERT INTO pages (file_hash, page_number, text) VALUES (?, ?, ?)",
+                [(file_hash, number, text) for number, text in enumerate(pages, start=1)]
+            )
+            self._conn.execute("INSERT OR REPLACE INTO files (file_hash, page_count) VALUES (?, ?)",
+                               (file_hash, len(pages)))
+            self._conn.commit()
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            try:
+                _page_cache = PageCache()
+            except sqlite3.Error as e:
+                logger.error(f"페이지 캐시를 열 수 없습니다 ({PAGE_CACHE_PATH}): {e}")
+                return None
+        return _page_cache
+
+
+# 워커에서 실행: 지정한 페이지 구간의 텍스트를 페이지당 한 번만 추출
+# PyPDF2는 추출할 때만 불러와 앱 시작 시 import 비용을 줄인다.
+def extract_page_range(data, start, stop):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(io.BytesIO(data))
+    texts = []
+    for page in reader.pages[start:stop]:
+        text = page.extract_text()
+        texts.append(text or "")
+    return texts
+
+
+def count_pages(data):
+    from PyPDF2 import PdfReader
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+
+# 파일을 페이지 구간 단위 작업으로 나눔 (큰 파일은 여러 워커가 나눠서 처리)
+def _split_tasks(page_count, pages_per_task):
+    if page_count <= pages_per_task:
+        return [(0, page_count)]
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+# PDF 추출용 워커 프로세스 풀
+# 여러 번의 extract_pdfs 호출(ingest의 파일 묶음마다)이 같은 워커 프로세스를 재사용한다.
+# 실행 중인 작업은 future.cancel()로 멈출 수 없으므로, 제한 시간을 넘긴 작업이 있으면
+# terminate()로 워커를 강제 종료하고 다음 submit 때 새 풀을 띄운다.
+class ExtractionPool:
+    def __init__(self, workers=None, start_method=None):
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        # Streamlit은 스레드를 사용하므로 fork 대신 spawn으로 워커 생성
+        self._context = multiprocessing.get_context(start_method or os.getenv("PDF_EXTRACT_START_METHOD", "spawn"))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context)
+            return self._executor.submit(fn, *args)
+
+    def terminate(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # ProcessPoolExecutor는 워커를 종료하는 공개 API가 없어 워커 프로세스 목록을 직접 사용
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        for process in processes:
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.join(timeout=5)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# PDF 텍스트 추출 엔진
+# files: (파일명, bytes) 목록. 결과는 입력 순서대로 (파일명, 페이지별 텍스트 또는 None) 목록.
+# 실패하거나 제한 시간을 넘긴 파일은 None으로 표시된다.
+# use_cache=True 이면 파일 해시 기준 페이지 캐시에 있는 파일은 파싱하지 않는다.
+# pool을 넘기면 그 워커를 사용하고(닫지 않음), 없으면 이번 호출에서만 쓸 풀을 만든다.
+def extract_pdfs(files, workers=None, timeout=None, pages_per_task=None, use_cache=True, pool=None):
+    with metrics.span("pdf_extraction", cached=use_cache) as span:
+        results = _extract_pdfs(files, workers, timeout, pages_per_task, use_cache, pool)
+        if metrics.enabled:
+            pages = sum(len(pages) for _, pages in results if pages)
+            span.set(files=len(files), pages=pages)
+            metrics.count("pdf_pages_total", pages)
+    return results
+
+
+def _extract_pdfs(files, workers, timeout, pages_per_task, use_cache, pool):
+    cache = get_page_cache() if use_cache else None
+    if cache is None:
+        return _extract_uncached(files, workers, timeout, pages_per_task, pool)
+
+    results = [None] * len(files)
+    misses, miss_positions, miss_hashes = [], [], []
+    for position, (name, data) in enumerate(files):
+        file_hash = cache.file_hash(data)
+        pages = cache.get_pages(file_hash)
+        if pages is not None:
+            logger.info(f"페이지 캐시 사용: {name} ({len(pages)}쪽)")
+            results[position] = (name, pages)
+        else:
+            misses.append((name, data))
+            miss_positions.append(position)
+            miss_hashes.append(file_hash)
+
+    extracted = _extract_uncached(misses, workers, timeout, pages_per_task, pool) if misses else []
+    for position, file_hash, (name, pages) in zip(miss_positions, miss_hashes, extracted):
+        if pages is not None:
+            cache.put_pages(file_hash, pages)
+        results[position] = (name, pages)
+    return results
+
+
+def _extract_uncached(files, workers=None, timeout=None, pages_per_task=None, pool=None):
+    workers = max(1, workers or DEFAULT_WORKERS)
+    timeout = timeout or DEFAULT_FILE_TIMEOUT
+    pages_per_task = max(1, pages_per_task or DEFAULT_PAGES_PER_TASK)
+
+    plans = []
+    for name, data in files:
+        try:
+            plans.append((name, data, _split_tasks(count_pages(data), pages_per_task)))
+        except Exception as e:
+            logger.error(f"{name} 읽기 오류: {e}")
+            plans.append((name, data, None))
+
+    task_count = sum(len(tasks) for _, _, tasks in plans if tasks)
+    if pool is None and (workers == 1 or task_count <= 1):
+        return [_extract_inline(name, data, tasks) for name, data, tasks in plans]
+
+    if pool is not None:
+        return _run_tasks(pool, plans, timeout)
+    with ExtractionPool(min(workers, task_count)) as own_pool:
+        return _run_tasks(own_pool, plans, timeout)
+
+
+def _extract_inline(name, data, tasks):
+    if tasks is None:
+        return name, None
+    try:
+        pages = []
+        for start, stop in tasks:
+            pages.extend(extract_page_range(data, start, stop))
+        logger.info(f"텍스트 추출 성공: {name} ({len(pages)}쪽)")
+        return name, pages
+    except Exception as e:
+        logger.error(f"{name} 읽기 오류: {e}")
+        return name, None
+
+
+# 페이지 구간 작업을 워커 수만큼만 제출하고, 끝나는 대로 다음 작업을 제출
+# 파일마다 첫 작업을 제출한 시각부터 timeout을 재고, 넘긴 파일이 있으면 워커를 종료한 뒤
+# 함께 중단된 다른 파일의 작업은 새 워커에서 다시 실행한다.
+def _run_tasks(pool, plans, timeout):
+    parts = [[None] * len(tasks) if tasks else None for _, _, tasks in plans]
+    failed = {index for index, (_, _, tasks) in enumerate(plans) if tasks is None}
+    pending = deque((index, position, start, stop) for index, (_, _, tasks) in enumerate(plans) if tasks
+                    for position, (start, stop) in enumerate(tasks))
+    submitted_at, remaining = {}, {index: len(tasks) for index, (_, _, tasks) in enumerate(plans) if tasks}
+    in_flight = {}
+    while pending or in_flight:
+        while pending and len(in_flight) < pool.workers:
+            task = pending.popleft()
+            index, _, start, stop = task
+            if index in failed:
+                continue
+            submitted_at.setdefault(index, time.monotonic())
+            in_flight[pool.submit(extract_page_range, plans[index][1], start, stop)] = task
+        if not in_flight:
+            break
+
+        next_deadline = min(submitted_at[index] + timeout for index, *_ in in_flight.values())
+        done, _ = wait(in_flight, timeout=max(0.0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            index, position, _, _ = in_flight.pop(future)
+            if index in failed:
+                continue
+            name = plans[index][0]
+            try:
+                parts[index][position] = future.result()
+            except Exception as e:
+                logger.error(f"{name} 읽기 오류: {e}")
+                failed.add(index)
+                if isinstance(e, BrokenProcessPool):
+                    # 워커가 비정상 종료된 풀은 다시 쓸 수 없으므로 다음 제출 때 새로 만듦
+                    pool.terminate()
+                continue
+            remaining[index] -= 1
+            if not remaining[index]:
+                pages = sum(len(part) for part in parts[index])
+                logger.info(f"텍스트 추출 성공: {name} ({pages}쪽, {time.monotonic() - submitted_at[index]:.2f}초)")
+
+        now = time.monotonic()
+        expired = {index for index, *_ in in_flight.values()
+                   if index not in failed and submitted_at[index] + timeout <= now}
+        if expired:
+            for index in sorted(expired):
+                logger.error(f"{plans[index][0]} 텍스트 추출 시간 초과 ({timeout}초), 워커를 종료합니다.")
+            failed.update(expired)
+            retry = [task for task in in_flight.values() if task[0] not in failed]
+            pool.terminate()
+            # 다른 파일 때문에 중단된 파일은 다시 제출할 때부터 시간을 잰다
+            for index in {task[0] for task in retry}:
+                submitted_at.pop(index, None)
+            in_flight = {}
+            pending.extendleft(reversed(retry))
+
+    return [(name, None if index in failed else [page for part in parts[index] for page in part])
+            for index, (name, _, _) in enumerate(plans)]
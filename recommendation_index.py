@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import threading
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_INDEX_PATH = os.getenv("RECOMMENDATION_INDEX_PATH", os.path.join(".cache", "recommendation_index.json"))
+
+# 색인에 저장하는 상품 필드 (상품 카드에 필요한 필드만)
+INDEX_FIELDS = ["filename", "category", "mbti", "summary", "key_facts"]
+
+
+# 조회 키: (MBTI, 카테고리), 값이 없으면 None (= 전체)
+# Weaviate의 Equal 필터는 대소문자를 구분하지 않으므로 MBTI는 대문자로 맞춘다.
+def index_key(mbti_type=None, category=None):
+    mbti_type = (mbti_type or "").strip().upper() or None
+    category = (category or "").strip() or None
+    return mbti_type, category
+
+
+# 상품 하나가 나타나는 조회 키: (MBTI, 카테고리), (MBTI, 전체), (전체, 카테고리), (전체, 전체)
+def product_keys(product):
+    mbti_type, category = index_key(product.get("mbti"), product.get("category"))
+    return {(mbti_type, category), (mbti_type, None), (None, category), (None, None)}
+
+
+# MBTI x 카테고리 추천 색인
+# 문서 ID -> 상품 카드, 조회 키 -> 문서 ID 집합을 메모리에 두고 JSON 파일로 저장한다.
+# 쓰기/수정/삭제가 일어나면 해당 문서가 속한(속했던) 키만 다시 만들고, 키별 상품 목록은
+# 처음 조회할 때 만들어 두므로 이후 조회는 dict 조회 한 번으로 끝난다.
+# 다른 프로세스(ingest.py 등)가 파일을 갱신하면 다음 조회 때 다시 읽는다.
+# 쓰기는 file lock 안에서 최신 파일을 다시 읽은 뒤 고쳐서 저장하므로 다른 프로세스의 변경을 덮어쓰지 않는다.
+class RecommendationIndex:
+    def __init__(self, path=RECOMMENDATION_INDEX_PATH):
+        self.path = path
+        self.ready = False
+        self._lock = threading.RLock()
+        self._products = {}
+        self._members = {}
+        self._views = {}
+        self._mtime = None
+        self._load()
+
+    def __len__(self):
+        return len(self._products)
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        mtime = self._file_mtime()
+        if mtime is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                products = json.load(f)["products"]
+        except Exception as e:
+            logger.error(f"추천 색인을 불러올 수 없습니다 ({self.path}): {e}")
+            return
+        with self._lock:
+            self._reset(products)
+            self._mtime = mtime
+            self.ready = True
+        logger.info(f"추천 색인 로드: {len(self._products)}개 상품")
+
+    def _reset(self, products):
+        self._products, self._members, self._views = {}, {}, {}
+        for product_id, product in products.items():
+            self._insert(product_id, product)
+
+    # 다른 프로세스가 저장한 색인 파일이 더 최신이면 다시 읽음
+    def refresh(self):
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime:
+            self._load()
+
+    def save(self):
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"products": self._products}, f, ensure_ascii=False)
+            os.replace(self.path + ".tmp", self.path)
+            self._mtime = self._file_mtime()
+
+    def _insert(self, product_id, product):
+        self._products[product_id] = product
+        for key in product_keys(product):
+            self._members.setdefault(key, {})[product_id] = None
+            self._views.pop(key, None)
+
+    def _discard(self, product_id):
+        product = self._products.pop(product_id, None)
+        if product is None:
+            return False
+        for key in product_keys(product):
+            members = self._members.get(key)
+            if members is not None:
+                members.pop(product_id, None)
+                if not members:
+                    del self._members[key]
+            self._views.pop(key, None)
+        return True
+
+    # Weaviate에서 읽은 전체 상품으로 색인을 새로 만듦 (objects: _additional.id가 있는 Document 목록)
+    def rebuild(self, objects):
+        products = {obj["_additional"]["id"]: {field: obj.get(field) for field in INDEX_FIELDS} for obj in objects}
+        with self._lock, file_lock(self.path):
+            self._reset(products)
+            self.ready = True
+            self.save()
+        logger.info(f"추천 색인 재생성: {len(products)}개 상품")
+        return len(products)
+
+    # 저장/수정된 문서 반영: [(문서 ID, 데이터 객체), ...]
+    def upsert(self, items):
+        count = 0
+        with self._lock, file_lock(self.path):
+            self.refresh()
+            for product_id, data_object in items:
+                self._discard(product_id)
+                self._insert(product_id, {field: data_object.get(field) for field in INDEX_FIELDS})
+                count += 1
+            if count and self.ready:
+                self.save()
+        return count
+
+    def remove(self, product_ids):
+        with self._lock, file_lock(self.path):
+            self.refresh()
+            removed = sum(1 for product_id in product_ids if self._discard(product_id))
+            if removed and self.ready:
+                self.save()
+        return removed
+
+    # (MBTI, 카테고리) 조건의 상품 목록 (반환된 목록은 수정하지 말 것)
+    def lookup(self, mbti_type=None, category=None):
+        key = index_key(mbti_type, category)
+        view = self._views.get(key)
+        if view is not None:
+            return view
+        with self._lock:
+            view = self._views.get(key)
+            if view is None:
+                members = self._members.get(key, {})
+                view = self._views[key] = [self._products[product_id] for product_id in members]
+        return view
@@ -0,0 +1,189 @@
+import functools
+import logging
+import os
+import re
+import time
+
+import openai
+
+from llm_scheduler import RETRYABLE_ERRORS, retry_delay
+from metrics import registry as metrics
+from pdf_extraction import split_pages
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "800"))
+CHUNK_OVERLAP_SENTENCES = int(os.getenv("CHUNK_OVERLAP_SENTENCES", "1"))
+
+CHUNK_CLASS = "DocumentChunk"
+CHUNK_FIELDS = ["filename", "chunk_index", "page_number", "content", "mbti", "category"]
+PAGE_CLASS = "DocumentPage"
+PAGE_FIELDS = ["filename", "page_number", "content", "mbti", "category"]
+
+# 문서 조각(DocumentChunk) 스키마: 벡터는 직접 계산해서 넣으므로 vectorizer 없음
+CHUNK_SCHEMA = {
+    "class": CHUNK_CLASS,
+    "description": "Sentence-bounded chunks of finance product documents",
+    "vectorizer": "none",
+    "properties": [
+        {"name": "filename", "dataType": ["text"], "description": "Source filename"},
+        {"name": "chunk_index", "dataType": ["int"], "description": "Position of the chunk in the document"},
+        {"name": "page_number", "dataType": ["int"], "description": "1-based PDF page the chunk comes from"},
+        {"name": "content", "dataType": ["text"], "description": "Chunk text"},
+        {"name": "mbti", "dataType": ["text"], "description": "MBTI type of the source document"},
+        {"name": "category", "dataType": ["text"], "description": "Category of the source document"}
+    ]
+}
+
+# 문서 페이지(DocumentPage) 스키마: 필요한 페이지만 따로 조회할 수 있도록 페이지 단위로 저장
+PAGE_SCHEMA = {
+    "class": PAGE_CLASS,
+    "description": "Single PDF pages of finance product documents",
+    "vectorizer": "none",
+    "properties": [
+        {"name": "filename", "dataType": ["text"], "description": "Source filename"},
+        {"name": "page_number", "dataType": ["int"], "description": "1-based PDF page number"},
+        {"name": "content", "dataType": ["text"], "description": "Page text"},
+        {"name": "mbti", "dataType": ["text"], "description": "MBTI type of the source document"},
+        {"name": "category", "dataType": ["text"], "description": "Category of the source document"}
+    ]
+}
+
+
+# NLTK 문장 분리 데이터가 로컬에 설치되어 있는지 확인 (프로세스당 한 번)
+# 실행 중에는 내려받지 않으므로 미리 설치해 둔다: python -m nltk.downloader punkt_tab
+@functools.lru_cache(maxsize=None)
+def has_sentence_tokenizer():
+    import nltk
+    for resource in ("tokenizers/punkt_tab/english/", "tokenizers/punkt/english.pickle"):
+        try:
+            nltk.data.find(resource)
+            return True
+        except LookupError:
+            continue
+    logger.warning("NLTK punkt 데이터가 없어 정규식으로 문장을 나눕니다. (python -m nltk.downloader punkt_tab)")
+    return False
+
+
+# 문장 단위 분리 (punkt 데이터가 없으면 문장 부호 기준 정규식으로 대체)
+# nltk는 import 비용이 커서 실제로 문장을 나눌 때만 불러온다.
+def split_sentences(text):
+    sentences = None
+    if has_sentence_tokenizer():
+        from nltk.tokenize import sent_tokenize
+        try:
+            sentences = sent_tokenize(text)
+        except LookupError:
+            pass
+    if sentences is None:
+        sentences = re.split(r'(?<=[.!?])\s+', text)
+    return [sentence.strip() for sentence in sentences if sentence.strip()]
+
+
+# 문장 경계를 지키면서 max_chars 이하의 조각으로 나누고,
+# 앞 조각의 마지막 overlap_sentences 문장을 다음 조각 앞에 겹쳐 붙인다.
+def chunk_text(text, max_chars=CHUNK_MAX_CHARS, overlap_sentences=CHUNK_OVERLAP_SENTENCES):
+    sentences = []
+    for sentence in split_sentences(text):
+        # 한 문장이 조각 크기보다 길면 강제로 자름
+        while len(sentence) > max_chars:
+            sentences.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if sentence:
+            sentences.append(sentence)
+
+    chunks = []
+    current, length = [], 0
+    for sentence in sentences:
+        if current and length + len(sentence) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current = current[-overlap_sentences:] if overlap_sentences > 0 else []
+            length = sum(len(s) + 1 for s in current)
+            if current and length + len(sentence) + 1 > max_chars:
+                current, length = [], 0
+        current.append(sentence)
+        length += len(sentence) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+# 페이지 구분자가 있는 본문을 페이지별로 조각내어 (페이지 번호, 조각) 목록으로 반환
+# 조각은 페이지를 넘지 않으므로 검색 결과마다 출처 페이지를 알 수 있다.
+def chunk_pages(content, max_chars=CHUNK_MAX_CHARS, overlap_sentences=CHUNK_OVERLAP_SENTENCES):
+    chunks = []
+    for page_number, page in enumerate(split_pages(content), start=1):
+        chunks.extend((page_number, chunk) for chunk in chunk_text(page, max_chars, overlap_sentences))
+    return chunks
+
+
+# 임베딩 API 호출: 일시적 오류(429, 5xx, 연결 오류)는 LLM 스케줄러와 같은 backoff로 재시도하고,
+# 재시도 후에도 실패하면 예외를 그대로 올린다.
+def create_embeddings(batch, model=EMBEDDING_MODEL, max_retries=EMBEDDING_MAX_RETRIES):
+    with metrics.span("embedding", model=model) as span:
+        for attempt in range(max_retries + 1):
+            try:
+                response = openai.Embedding.create(model=model, input=batch)
+                span.set(texts=len(batch), retries=attempt)
+                return response
+            except RETRYABLE_ERRORS as e:
+                if attempt >= max_retries:
+                    raise
+                delay = retry_delay(attempt, e)
+                metrics.count("embedding_retries_total", model=model, error=type(e).__name__)
+                logger.warning(f"임베딩 요청 실패 ({type(e).__name__}), {delay:.1f}초 후 재시도 "
+                               f"{attempt + 1}/{max_retries}: {e}")
+                time.sleep(delay)
+
+
+# 여러 텍스트를 batch_size 단위로 묶어 임베딩 API 호출 횟수를 줄임
+def embed_texts(texts, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, max_retries=EMBEDDING_MAX_RETRIES):
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        response = create_embeddings(batch, model=model, max_retries=max_retries)
+        metrics.count("embedding_texts_total", len(batch), model=model)
+        data = sorted(response["data"], key=lambda item: item["index"])
+        vectors.extend(item["embedding"] for item in data)
+    return vectors
+
+
+# MBTI/카테고리 조건을 Weaviate where 필터로 변환
+def build_where(mbti_type=None, category=None):
+    operands = []
+    if mbti_type:
+        operands.append({"path": ["mbti"], "operator": "Equal", "valueText": mbti_type})
+    if category:
+        operands.append({"path": ["category"], "operator": "Equal", "valueText": category})
+    if not operands:
+        return None
+    if len(operands) == 1:
+        return operands[0]
+    return {"operator": "And", "operands": operands}
+
+
+# Weaviate에 저장된 문서 조각에 대한 top-k nearVector 검색
+class WeaviateChunkStore:
+    def __init__(self, client, class_name=CHUNK_CLASS):
+        self.client = client
+        self.class_name = class_name
+
+    def search(self, vector, k=5, mbti_type=None, category=None):
+        query = (
+            self.client.query.get(self.class_name, CHUNK_FIELDS)
+            .with_near_vector({"vector": vector})
+            .with_limit(k)
+            .with_additional(["id", "distance"])
+        )
+        where = build_where(mbti_type, category)
+        if where:
+            query = query.with_where(where)
+        response = query.do()
+        chunks = response.get("data", {}).get("Get", {}).get(self.class_name) or []
+        for chunk in chunks:
+            distance = (chunk.get("_additional") or {}).get("distance")
+            chunk["score"] = 1 - distance if distance is not None else 0.0
+        return chunks
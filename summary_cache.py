@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", os.path.join(".cache", "summary_cache.sqlite3"))
+DEFAULT_MEMORY_ENTRIES = int(os.getenv("SUMMARY_CACHE_MEMORY_ENTRIES", "256"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "10000"))
+DEFAULT_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+# 요약 캐시 키: 잘린 입력 텍스트 + 모델 + 프롬프트의 해시
+def summary_cache_key(text, model, prompt):
+    digest = hashlib.sha256()
+    for part in (model, prompt, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# 메모리 LRU + SQLite 디스크 저장소로 구성된 요약 캐시
+# 항목은 파일명으로 태그되어 문서 수정/삭제 시 해당 파일의 요약만 무효화할 수 있다.
+class SummaryCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, filename TEXT, summary TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_filename ON summaries(filename)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # 디스크 저장소를 쓸 수 없으면 메모리 캐시만 사용
+            logger.error(f"요약 캐시 DB를 열 수 없습니다 ({path}): {e}")
+            self._conn = None
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[2]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT filename, summary, created_at FROM summaries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[2]):
+                        self._remember(key, row)
+                        self.hits += 1
+                        return row[1]
+                    self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key, summary, filename=None):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, (filename, summary, created_at))
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO summaries (key, filename, summary, created_at) VALUES (?, ?, ?, ?)",
+                    (key, filename, summary, created_at)
+                )
+                self._evict()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"요약 캐시 저장 오류: {e}")
+
+    # 파일 하나와 연결된 요약을 모두 무효화
+    def invalidate(self, filename):
+        with self._lock:
+            for key in [k for k, entry in self._memory.items() if entry[0] == filename]:
+                del self._memory[key]
+            if self._conn is None:
+                return 0
+            try:
+                removed = self._conn.execute("DELETE FROM summaries WHERE filename = ?", (filename,)).rowcount
+                self._conn.commit()
+                logger.info(f"{filename} 요약 캐시 {removed}건 무효화")
+                return removed
+            except sqlite3.Error as e:
+                logger.error(f"요약 캐시 무효화 오류: {e}")
+                return 0
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM summaries")
+                self._conn.commit()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    # TTL이 지난 항목과 최대 개수를 넘는 오래된 항목 정리
+    def _evict(self):
+        if self.ttl > 0:
+            self._conn.execute("DELETE FROM summaries WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM summaries WHERE key IN ("
+            "SELECT key FROM summaries ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
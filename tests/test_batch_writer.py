@@ -0,0 +1,33 @@
+import os
+import sys
+
+import weaviate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_writer import BatchWriter  # noqa: E402
+from benchmark import FakeWeaviate  # noqa: E402
+
+
+# 클라이언트 기본 batch(dynamic, 약 50개)의 자동 전송보다 큰 배치에서 일부 객체만 실패하는 경우
+def test_partial_failures_in_large_batch_are_reported():
+    fake = FakeWeaviate().start()
+    try:
+        client = weaviate.Client(fake.url)
+        written = []
+        writer = BatchWriter(client, batch_size=200, max_retries=1, on_success=written.extend)
+        ids = [f"00000000-0000-0000-0000-{index:012d}" for index in range(120)]
+        fake.rejected_ids.update(ids[::10])
+
+        with writer:
+            for index, object_id in enumerate(ids):
+                writer.add({"filename": f"doc{index}.pdf"}, class_name="Document", uuid=object_id)
+
+        failed = {failure["uuid"] for failure in writer.failed}
+        assert failed == fake.rejected_ids
+        assert set(writer.succeeded) == set(ids) - failed
+        assert {item["uuid"] for item in written} == set(ids) - failed
+        assert writer.requests_sent == fake.requests["POST /batch/objects"] == 2
+        assert set(fake.objects["Document"]) == set(ids) - failed
+    finally:
+        fake.stop()
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(".cache", "vector_index"))
+LOCAL_INDEX_PARTITIONS = int(os.getenv("LOCAL_INDEX_PARTITIONS", "0"))
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "4"))
+
+FILTER_FIELDS = ("mbti", "category")
+
+
+# 행 단위 L2 정규화 (정규화된 벡터의 내적 = 코사인 유사도)
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# 코사인 k-means (spherical k-means)
+# 정규화된 벡터를 k개 그룹으로 나누고 (중심 벡터, 각 행의 그룹 번호)를 반환
+def kmeans(vectors, k, iterations=20, seed=0):
+    vectors = normalize_rows(vectors)
+    count = len(vectors)
+    k = max(1, min(k, count))
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(count, size=k, replace=False)].copy()
+    assignments = np.zeros(count, dtype=np.int32)
+    for iteration in range(iterations):
+        new_assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        if iteration > 0 and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+        for cluster in range(k):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+            else:
+                # 빈 그룹은 현재 중심에서 가장 먼 벡터로 다시 시작
+                farthest = np.argmin(np.max(vectors @ centroids.T, axis=1))
+                centroids[cluster] = vectors[farthest]
+        centroids = normalize_rows(centroids)
+    return centroids, assignments
+
+
+# 로컬 벡터 인덱스
+# 문서 조각 임베딩을 memory-mapped float32 행렬(vectors.f32)로, 메타데이터를 meta.json으로 저장한다.
+# 검색은 NumPy 행렬곱으로 하는 전수 코사인 검색이고, partitions > 0 이면 IVF 방식으로
+# 질문과 가까운 nprobe개 파티션만 검색한다. mbti/category 필터는 미리 만든 boolean mask로 적용한다.
+# add()로 들어온 조각은 대기 목록에 쌓아 두었다가 검색/저장 시점에 한 번에 합치고 mask/파티션을 다시 만든다.
+# 마지막 저장 이후의 변경은 journal에 남겨 두고, 저장할 때 다른 프로세스가 그 사이 파일을 바꿨으면
+# file lock 안에서 최신 파일을 다시 읽고 journal을 다시 적용한 뒤 저장한다.
+class NumpyChunkIndex:
+    def __init__(self, directory=LOCAL_INDEX_DIR, partitions=LOCAL_INDEX_PARTITIONS, nprobe=LOCAL_INDEX_NPROBE):
+        self.directory = directory
+        self.partitions = partitions
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._records = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._masks = {}
+        self._centroids = None
+        self._assignments = None
+        self._pending_records = []
+        self._pending_vectors = []
+        self._journal = []
+        self._mtime = None
+        # 마지막 저장 이후 바뀐 내용이 있는지
+        self.dirty = False
+        self._load()
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def __len__(self):
+        return len(self._records) + len(self._pending_records)
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.meta_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        self._reset([], [])
+        self._mtime = self._file_mtime()
+        if self._mtime is None:
+            return
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            records, dim = meta["records"], meta["dim"]
+            if records:
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(records), dim))
+            self._records = records
+            self._rebuild()
+            logger.info(f"로컬 벡터 인덱스 로드: {len(records)}개 조각 ({self.directory})")
+        except Exception as e:
+            logger.error(f"로컬 벡터 인덱스를 불러올 수 없습니다: {e}")
+            self._reset([], [])
+
+    def save(self):
+        with self._lock, file_lock(self.meta_path):
+            if self._file_mtime() != self._mtime:
+                journal = self._journal
+                self._load()
+                self._replay(journal)
+            self._apply_pending()
+            count = len(self._records)
+            dim = self._matrix.shape[1] if count else 0
+            tmp_path = self.vectors_path + ".tmp"
+            if count:
+                out = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(count, dim))
+                out[:] = self._matrix
+                out.flush()
+                del out
+            else:
+                open(tmp_path, "wb").close()
+            os.replace(tmp_path, self.vectors_path)
+            with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "records": self._records}, f, ensure_ascii=False)
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+            if count:
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, dim))
+            self._mtime = self._file_mtime()
+            self._journal = []
+            self.dirty = False
+
+    def _replay(self, journal):
+        for operation, *arguments in journal:
+            if operation == "add":
+                self._add(*arguments)
+            elif operation == "remove":
+                self._remove(*arguments)
+            elif operation == "remove_ids":
+                self._remove_ids(*arguments)
+            else:
+                self._reset(*arguments)
+
+    def _record(self, *operation):
+        self._journal.append(operation)
+        self.dirty = True
+
+    # records: 조각 메타데이터(dict) 목록, vectors: 같은 길이의 임베딩 목록
+    # 대기 목록에만 추가하므로 문서마다 행렬을 다시 만들지 않는다.
+    def add(self, records, vectors):
+        if not records:
+            return
+        records, vectors = [dict(record) for record in records], normalize_rows(vectors)
+        with self._lock:
+            self._add(records, vectors)
+            self._record("add", records, vectors)
+
+    def _add(self, records, vectors):
+        self._pending_records.extend(records)
+        self._pending_vectors.append(vectors)
+
+    # 대기 중인 조각을 행렬에 한 번에 합치고 mask/파티션을 다시 계산
+    def _apply_pending(self):
+        if not self._pending_records:
+            return
+        vectors = np.vstack(self._pending_vectors)
+        if len(self._records):
+            self._matrix = np.vstack([np.asarray(self._matrix), vectors])
+        else:
+            self._matrix = vectors
+        self._records.extend(self._pending_records)
+        self._pending_records, self._pending_vectors = [], []
+        self._rebuild()
+
+    # 인덱스 전체를 주어진 조각들로 교체
+    def reset(self, records, vectors):
+        records = [dict(record) for record in records]
+        vectors = normalize_rows(vectors) if records else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self._reset(records, vectors)
+            self._record("reset", records, vectors)
+
+    def _reset(self, records, vectors):
+        self._pending_records, self._pending_vectors = [], []
+        self._records = list(records)
+        self._matrix = vectors if len(records) else np.zeros((0, 0), dtype=np.float32)
+        self._rebuild()
+
+    # 다른 프로세스가 같은 파일의 조각을 추가했을 수 있으므로 지운 것이 없어도 journal에 남긴다.
+    def remove(self, filename):
+        with self._lock:
+            self._record("remove", filename)
+            return self._remove(filename)
+
+    # 조각 UUID로 삭제 (같은 파일명으로 새로 저장된 조각은 남음)
+    def remove_ids(self, ids):
+        ids = {str(object_id) for object_id in ids}
+        with self._lock:
+            self._record("remove_ids", ids)
+            return self._remove_ids(ids)
+
+    def _remove(self, filename):
+        return self._remove_matching(lambda record: record.get("filename") == filename)
+
+    def _remove_ids(self, ids):
+        return self._remove_matching(lambda record: record.get("id") in ids)
+
+    def _remove_matching(self, predicate):
+        self._apply_pending()
+        keep = np.array([not predicate(record) for record in self._records], dtype=bool)
+        removed = int((~keep).sum())
+        if removed:
+            self._matrix = np.asarray(self._matrix)[keep]
+            self._records = [record for record, kept in zip(self._records, keep) if kept]
+            self._rebuild()
+        return removed
+
+    # 필터 mask와 IVF 파티션을 다시 계산 (쓰기 시에만 수행)
+    def _rebuild(self):
+        masks = {}
+        for field in FILTER_FIELDS:
+            values = np.array([record.get(field) or "" for record in self._records], dtype=object)
+            for value in set(values):
+                masks[(field, value)] = values == value
+        self._masks = masks
+
+        self._centroids, self._assignments = None, None
+        if self.partitions > 0 and len(self._records) >= self.partitions * 4:
+            self._centroids, self._assignments = kmeans(np.asarray(self._matrix), self.partitions)
+
+    def _filter_mask(self, mbti_type=None, category=None):
+        mask = None
+        for field, value in (("mbti", mbti_type), ("category", category)):
+            if not value:
+                continue
+            field_mask = self._masks.get((field, value))
+            if field_mask is None:
+                return np.zeros(len(self._records), dtype=bool)
+            mask = field_mask if mask is None else mask & field_mask
+        return mask
+
+    def search(self, vector, k=5, mbti_type=None, category=None):
+        with self._lock:
+            self._apply_pending()
+            if not self._records:
+                return []
+            query = normalize_rows(vector)[0]
+            candidates = self._filter_mask(mbti_type, category)
+
+            if self._centroids is not None:
+                probes = np.argsort(self._centroids @ query)[::-1][:self.nprobe]
+                partition_mask = np.isin(self._assignments, probes)
+                combined = partition_mask if candidates is None else candidates & partition_mask
+                # 파티션 안에 결과가 부족하면 전체(필터 조건만)에서 검색
+                if combined.sum() >= k:
+                    candidates = combined
+
+            if candidates is None:
+                rows = np.arange(len(self._records))
+                scores = self._matrix @ query
+            else:
+                rows = np.flatnonzero(candidates)
+                if not len(rows):
+                    return []
+                scores = self._matrix[rows] @ query
+
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for position in top:
+                record = dict(self._records[rows[position]])
+                record["score"] = float(scores[position])
+                results.append(record)
+            return results
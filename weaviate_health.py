@@ -0,0 +1,212 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# 상태 확인 주기(초), 확인 요청 제한 시간(초), 회로를 여는 연속 실패 수, 실패 시 재확인 backoff 범위(초)
+HEALTH_CHECK_INTERVAL = float(os.getenv("WEAVIATE_HEALTH_INTERVAL", "15"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("WEAVIATE_HEALTH_TIMEOUT", "2"))
+FAILURE_THRESHOLD = int(os.getenv("WEAVIATE_FAILURE_THRESHOLD", "3"))
+BACKOFF_BASE = float(os.getenv("WEAVIATE_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("WEAVIATE_BACKOFF_MAX", "60"))
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+
+# 서버 과부하/중단을 뜻하는 응답 코드 (그 외 응답은 연결이 살아 있는 것으로 본다)
+UNAVAILABLE_STATUS_CODES = {502, 503, 504}
+
+
+# 회로가 열려 있어 요청을 보내지 않고 바로 실패
+# 기존 코드의 연결 오류 처리 경로를 그대로 타도록 requests의 ConnectionError를 상속한다.
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+# Weaviate 상태 감시와 circuit breaker
+# 백그라운드 스레드가 /v1/.well-known/ready 를 주기적으로 확인해 준비 상태를 캐시하고,
+# 실패하면 지수 backoff(+jitter) 간격으로 다시 확인한다. 확인 요청과 실제 요청을 합쳐
+# failure_threshold번 연속 실패하면 회로를 열고, 다음 확인이 성공할 때까지 요청을 바로 거절한다.
+class WeaviateHealthMonitor:
+    def __init__(self, url, interval=HEALTH_CHECK_INTERVAL, timeout=HEALTH_CHECK_TIMEOUT,
+                 failure_threshold=FAILURE_THRESHOLD, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.url = (url or "").rstrip("/")
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = max(1, failure_threshold)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.ready = None  # 첫 확인 전에는 None
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_checked = None
+        self._lock = threading.Lock()
+        self._checked = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._session = requests.Session()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="weaviate-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # 첫 상태 확인이 끝날 때까지 최대 timeout초 대기하고 준비 여부를 반환
+    def wait_until_checked(self, timeout=None):
+        self._checked.wait(self.timeout if timeout is None else timeout)
+        return bool(self.ready)
+
+    def allow_request(self):
+        return self.state != CIRCUIT_OPEN
+
+    def probe(self):
+        try:
+            response = self._session.get(f"{self.url}/v1/.well-known/ready", timeout=self.timeout)
+            if response.status_code == 200:
+                return True, None
+            return False, f"status {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            return False, str(e)
+
+    def record_success(self):
+        with self._lock:
+            if self.state == CIRCUIT_OPEN:
+                logger.info("Weaviate 연결이 복구되어 회로를 닫습니다.")
+            self.state = CIRCUIT_CLOSED
+            self.ready = True
+            self.consecutive_failures = 0
+            self.last_error = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.ready = False
+            self.last_error = str(error) if error is not None else None
+            if self.state != CIRCUIT_OPEN and self.consecutive_failures >= self.failure_threshold:
+                self.state = CIRCUIT_OPEN
+                logger.error(f"Weaviate 요청이 {self.consecutive_failures}번 연속 실패해 회로를 엽니다: {error}")
+
+    # 실패 횟수에 따라 2배씩 늘어나는 재확인 간격 (동시에 몰리지 않도록 jitter 추가)
+    def backoff_delay(self):
+        exponent = max(0, self.consecutive_failures - 1)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** exponent))
+        return random.uniform(delay / 2, delay)
+
+    def check(self):
+        ok, error = self.probe()
+        if ok:
+            self.record_success()
+        else:
+            logger.warning(f"Weaviate 상태 확인 실패 ({self.consecutive_failures + 1}회 연속): {error}")
+            self.record_failure(error)
+        self.last_checked = time.time()
+        self._checked.set()
+        return ok
+
+    def _run(self):
+        while not self._stop.is_set():
+            ok = self.check()
+            if self._stop.wait(self.interval if ok else self.backoff_delay()):
+                return
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+                "last_checked": self.last_checked,
+            }
+
+
+# 요청 URL -> 측정용 작업 이름 (query, batch_write, batch_delete, schema, object_get 등)
+def weaviate_operation(method, url):
+    path = url.split("?", 1)[0]
+    if "/v1/graphql" in path:
+        return "query"
+    if "/v1/batch/" in path:
+        return "batch_delete" if method == "DELETE" else "batch_write"
+    if "/v1/schema" in path:
+        return "schema"
+    if "/v1/objects" in path:
+        return f"object_{method.lower()}"
+    return "other"
+
+
+# 회로 상태를 확인한 뒤 요청을 보내고 결과를 monitor에 기록하는 HTTP adapter
+# Weaviate 클라이언트의 모든 요청(조회, 배치, 스키마)이 같은 세션을 쓰므로 여기서 한 번에 처리된다.
+class CircuitBreakerAdapter(HTTPAdapter):
+    def __init__(self, monitor, **kwargs):
+        self.monitor = monitor
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        operation = weaviate_operation(request.method, request.url) if metrics.enabled else None
+        if not self.monitor.allow_request():
+            metrics.count("weaviate_errors_total", operation=operation, reason="circuit_open")
+            raise CircuitOpenError(f"Weaviate 회로가 열려 있어 요청을 보내지 않습니다: {request.url}", request=request)
+        with metrics.span("weaviate_request", operation=operation) as span:
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.monitor.record_failure(e)
+                metrics.count("weaviate_errors_total", operation=operation, reason=type(e).__name__)
+                raise
+            span.set(status=response.status_code)
+        if response.status_code in UNAVAILABLE_STATUS_CODES:
+            self.monitor.record_failure(f"status {response.status_code}")
+            metrics.count("weaviate_errors_total", operation=operation, reason=f"status_{response.status_code}")
+        else:
+            self.monitor.record_success()
+        return response
+
+
+# Weaviate 클라이언트를 처음 사용할 때 만드는 proxy
+# 서버가 내려가 있어도 앱이 뜰 수 있도록 생성(네트워크 확인 포함)을 첫 사용 시점으로 미루고,
+# 회로가 열려 있으면 생성 시도 없이 바로 CircuitOpenError를 낸다.
+class GuardedClient:
+    def __init__(self, factory, monitor, pool_connections=10, pool_maxsize=10):
+        self._factory = factory
+        self._monitor = monitor
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is not None:
+            return self._client
+        with self._lock:
+            if self._client is None:
+                if not self._monitor.allow_request():
+                    raise CircuitOpenError("Weaviate 회로가 열려 있어 클라이언트를 만들지 않습니다.")
+                try:
+                    client = self._factory()
+                except requests.exceptions.RequestException as e:
+                    self._monitor.record_failure(e)
+                    raise
+                # v3 클라이언트가 내부에서 쓰는 requests 세션에 adapter를 연결 (연결 풀 크기는 그대로 유지)
+                adapter = CircuitBreakerAdapter(self._monitor, pool_connections=self._pool_connections,
+                                                pool_maxsize=self._pool_maxsize)
+                client._connection._session.mount("http://", adapter)
+                client._connection._session.mount("https://", adapter)
+                self._client = client
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get_client(), name)